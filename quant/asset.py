@@ -8,7 +8,14 @@ Date:   2019/02/16
 Email:  huangtao@ifclover.com
 """
 
-import json
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
+    _json_dumps = json.dumps
 
 
 class Asset:
@@ -22,6 +29,8 @@ class Asset:
         update: If any update? True or False.
     """
 
+    __slots__ = ("platform", "account", "assets", "timestamp", "update")
+
     def __init__(self, platform=None, account=None, assets=None, timestamp=None, update=False):
         """ Initialize. """
         self.platform = platform
@@ -42,7 +51,7 @@ class Asset:
         return d
 
     def __str__(self):
-        info = json.dumps(self.data)
+        info = _json_dumps(self.data)
         return info
 
     def __repr__(self):
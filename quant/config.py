@@ -8,7 +8,10 @@ Date:   2018/05/03
 Email:  huangtao@ifclover.com
 """
 
-import json
+try:
+    import orjson as json
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
 
 from quant.utils import tools
 from quant.utils import logger
@@ -32,6 +35,21 @@ class Config:
             PROXY: HTTP proxy config, default is None.
     """
 
+    # Build-in fields and default values if missing, e.g. (attribute name, config key, default value or a factory).
+    _FIELDS = (
+        ("server_id", "SERVER_ID", tools.get_uuid1),
+        ("run_time_update", "RUN_TIME_UPDATE", False),
+        ("log", "LOG", dict),
+        ("rabbitmq", "RABBITMQ", None),
+        ("mongodb", "MONGODB", None),
+        ("redis", "REDIS", None),
+        ("platforms", "PLATFORMS", dict),
+        ("accounts", "ACCOUNTS", list),
+        ("markets", "MARKETS", list),
+        ("heartbeat", "HEARTBEAT", dict),
+        ("proxy", "PROXY", None),
+    )
+
     def __init__(self):
         self.server_id = None
         self.run_time_update = False
@@ -44,6 +62,7 @@ class Config:
         self.markets = {}
         self.heartbeat = {}
         self.proxy = None
+        self._event_params = None  # The latest params received from EventConfig.
 
     def register_run_time_update(self):
         """Subscribe EventConfig and that can update config in run-time dynamically."""
@@ -60,7 +79,7 @@ class Config:
         configures = {}
         if config_file:
             try:
-                with open(config_file) as f:
+                with open(config_file, "rb") as f:
                     data = f.read()
                     configures = json.loads(data)
             except Exception as e:
@@ -85,6 +104,10 @@ class Config:
         if not isinstance(params, dict):
             logger.error("params format error:", params, caller=self)
             return
+        if params == self._event_params:
+            logger.info("config not changed.", caller=self)
+            return
+        self._event_params = dict(params)
 
         params["SERVER_ID"] = self.server_id
         params["RUN_TIME_UPDATE"] = self.run_time_update
@@ -97,20 +120,12 @@ class Config:
         Args:
             update_fields: Update fields.
         """
-        self.server_id = update_fields.get("SERVER_ID", tools.get_uuid1())
-        self.run_time_update = update_fields.get("RUN_TIME_UPDATE", False)
-        self.log = update_fields.get("LOG", {})
-        self.rabbitmq = update_fields.get("RABBITMQ", None)
-        self.mongodb = update_fields.get("MONGODB", None)
-        self.redis = update_fields.get("REDIS", None)
-        self.platforms = update_fields.get("PLATFORMS", {})
-        self.accounts = update_fields.get("ACCOUNTS", [])
-        self.markets = update_fields.get("MARKETS", [])
-        self.heartbeat = update_fields.get("HEARTBEAT", {})
-        self.proxy = update_fields.get("PROXY", None)
+        for attr, key, default in self._FIELDS:
+            if key not in update_fields:
+                setattr(self, attr, default() if callable(default) else default)
 
         for k, v in update_fields.items():
-            setattr(self, k, v)
+            setattr(self, k.lower(), v)
 
 
 config = Config()
@@ -8,12 +8,44 @@ Date:   2018/05/04
 Email:  huangtao@ifclover.com
 """
 
-import json
-import zlib
+import sys
 import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import aioamqp
 
+try:
+    from isal import isal_zlib as zlib  # SIMD accelerated, compatible with stdlib zlib.
+except ImportError:
+    import zlib
+
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    _json_loads = orjson.loads
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
+
+    def _json_dumps(obj):
+        return json.dumps(obj).encode("utf8")
+
+    _json_loads = json.loads
+
+try:
+    import zstandard
+except ImportError:  # Fallback to zlib if zstandard is not installed.
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:  # Fallback to json if msgpack is not installed.
+    msgpack = None
+
 from quant import const
 from quant.utils import logger
 from quant.config import config
@@ -29,6 +61,120 @@ __all__ = ("EventCenter", "EventConfig", "EventHeartbeat", "EventAsset", "EventO
            "EventTrade")
 
 
+# Payload frame flags, the first byte of a published message. The low bits are compression codec, and
+# `FRAME_MSGPACK` bit is set if the payload is serialized by msgpack instead of json. msgpack is only used if
+# `"msgpack": true` is set in RABBITMQ config, all consumers MUST have msgpack installed before enabling it.
+# Likewise `FRAME_ZSTD` is only used if `"zstd": true` is set, otherwise large payloads are compressed by zlib.
+# Flag byte is only written if one of these codecs is enabled, otherwise messages are published as legacy frames,
+# which have no flag byte and always start with zlib header byte `0x78`, so that consumers of previous releases can
+# decode them too.
+FRAME_RAW = b"\x00"
+FRAME_ZLIB = b"\x01"
+FRAME_ZSTD = b"\x02"
+FRAME_MSGPACK = 0x10
+_FRAME_COMPRESS_MASK = 0x0F
+_FRAME_FLAGS_MASK = FRAME_MSGPACK | 0x03
+
+# Payloads smaller than this size(bytes) are published without compression as `FRAME_RAW`, the codec overhead is not
+# worth it. Legacy frames are always compressed, so this only works if msgpack or zstd is enabled.
+COMPRESS_MIN_SIZE = 256
+
+# Publish events in batches, a batch is flushed when it holds `PUBLISH_BATCH_SIZE` events or after
+# `PUBLISH_BATCH_INTERVAL` seconds since the first event of this batch is queued.
+PUBLISH_BATCH_SIZE = 64
+PUBLISH_BATCH_INTERVAL = 0.002
+
+# Payloads larger than this size(bytes) are decoded in a thread pool, so that the io loop won't be blocked.
+DECODE_IN_EXECUTOR_SIZE = 4096
+
+# Default max waiting time(seconds) of a batch subscription before dispatching the received messages.
+CONSUME_BATCH_INTERVAL = 0.01
+
+# Raw content dictionary for zstd, built from the field keys every event payload repeats. All processes MUST share
+# the same dictionary, so it is defined here instead of being trained at run-time.
+_ZSTD_DICT_CONTENT = (
+    b'{"n":"EVENT_HEARTBEAT","d":{"server_id":"","count":0}}'
+    b'{"n":"EVENT_CONFIG","d":{"server_id":"","params":{}}}'
+    b'{"n":"EVENT_ASSET","d":{"platform":"","account":"","assets":{"BTC":{"free":"0","locked":"0","total":"0"}},'
+    b'"timestamp":0,"update":false}}'
+    b'{"n":"EVENT_ORDER","d":{"platform":"","account":"","strategy":"","order_no":"","action":"BUY","order_type":'
+    b'"LIMIT","symbol":"","price":"0","quantity":"0","remain":"0","status":"SUBMITTED","avg_price":"0",'
+    b'"trade_type":0,"ctime":0,"utime":0}}'
+    b'{"n":"EVENT_KLINE","d":{"platform":"","symbol":"","open":"0","high":"0","low":"0","close":"0","volume":"0",'
+    b'"timestamp":0,"kline_type":"kline"}}'
+    b'{"n":"EVENT_TRADE","d":{"platform":"","symbol":"","action":"SELL","price":"0","quantity":"0","timestamp":0}}'
+    b'{"n":"EVENT_ORDERBOOK","d":{"platform":"","symbol":"","asks":[["0.0","0.0"]],"bids":[["0.0","0.0"]],'
+    b'"timestamp":0}}'
+)
+
+if zstandard:
+    _ZSTD_DICT = zstandard.ZstdCompressionDict(_ZSTD_DICT_CONTENT, dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+    _ZSTD_COMPRESSOR = zstandard.ZstdCompressor(level=3, dict_data=_ZSTD_DICT)
+else:
+    _ZSTD_DICT = None
+    _ZSTD_COMPRESSOR = None
+
+# zstd decompressor is not thread safe, every thread holds its own decompressor.
+_ZSTD_LOCAL = threading.local()
+
+# Thread pool for decoding large payloads.
+_DECODE_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="EventDecode")
+
+
+def _codec_enabled(name):
+    """Check if an optional payload codec is enabled in RABBITMQ config, e.g. `msgpack` or `zstd`."""
+    return bool(config.rabbitmq and config.rabbitmq.get(name))
+
+
+def _decode_payload(b):
+    """ Decode a published payload to dict, it's thread safe.
+
+    Args:
+        b: Payload bytes, with a frame flag byte at the beginning.
+
+    Returns:
+        d: Decoded dict, e.g. {"n": name, "d": data}
+
+    Raises:
+        ValueError: If the payload is encoded by an optional codec which is not installed.
+    """
+    flags = b[0]
+    if flags & ~_FRAME_FLAGS_MASK:
+        return _json_loads(zlib.decompress(b))
+    flag = bytes((flags & _FRAME_COMPRESS_MASK,))
+    if flag == FRAME_RAW:
+        b = b[1:]
+    elif flag == FRAME_ZSTD:
+        if not zstandard:
+            raise ValueError("payload is compressed by zstd, but zstandard is not installed")
+        decompressor = getattr(_ZSTD_LOCAL, "decompressor", None)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor(dict_data=_ZSTD_DICT)
+            _ZSTD_LOCAL.decompressor = decompressor
+        b = decompressor.decompress(b[1:])
+    else:
+        b = zlib.decompress(b[1:])
+    if flags & FRAME_MSGPACK:
+        if not msgpack:
+            raise ValueError("payload is serialized by msgpack, but msgpack is not installed")
+        d = msgpack.unpackb(b, raw=False, strict_map_key=False)
+    else:
+        d = _json_loads(b)
+    return d
+
+
+@functools.lru_cache(maxsize=4096)
+def _join_key2(a, b):
+    """Build and intern a composite key `a.b`, e.g. routing key or queue name."""
+    return sys.intern(f"{a}.{b}")
+
+
+@functools.lru_cache(maxsize=4096)
+def _join_key3(a, b, c):
+    """Build and intern a composite key `a.b.c`, e.g. routing key or queue name."""
+    return sys.intern(f"{a}.{b}.{c}")
+
+
 class Event:
     """ Event base.
 
@@ -41,6 +187,12 @@ class Event:
         data: Message content.
     """
 
+    # If print the whole data in `__str__`, otherwise only the data length is printed.
+    VERBOSE_STR = False
+
+    __slots__ = ("_name", "_exchange", "_queue", "_routing_key", "_pre_fetch_count", "_data", "_callback", "_dumped",
+                 "_str", "_turn")
+
     def __init__(self, name=None, exchange=None, queue=None, routing_key=None, pre_fetch_count=1, data=None):
         """Initialize."""
         self._name = name
@@ -50,6 +202,9 @@ class Event:
         self._pre_fetch_count = pre_fetch_count
         self._data = data
         self._callback = None  # Asynchronous callback function.
+        self._dumped = None  # Cached serialized payload, event data won't change after created.
+        self._str = None  # Cached string of this event.
+        self._turn = None  # Future of the latest received message, done when it's ready to be dispatched.
 
     @property
     def name(self):
@@ -76,51 +231,129 @@ class Event:
         return self._data
 
     def dumps(self):
+        if self._dumped is not None:
+            return self._dumped
         d = {
             "n": self.name,
             "d": self.data
         }
-        s = json.dumps(d)
-        b = zlib.compress(s.encode("utf8"))
+        use_msgpack = msgpack is not None and _codec_enabled("msgpack")
+        use_zstd = zstandard is not None and _codec_enabled("zstd")
+        if use_msgpack:
+            s = msgpack.packb(d, use_bin_type=True)
+        else:
+            s = _json_dumps(d)
+        if not (use_msgpack or use_zstd):
+            # Legacy frame without flag byte, so that consumers of previous releases can still decode it.
+            b = zlib.compress(s)
+            self._dumped = b
+            return b
+        if len(s) < COMPRESS_MIN_SIZE:  # Consumers of previous releases can't decode it, same as zstd and msgpack.
+            flag, b = FRAME_RAW, s
+        elif use_zstd:
+            flag, b = FRAME_ZSTD, _ZSTD_COMPRESSOR.compress(s)
+        else:
+            flag, b = FRAME_ZLIB, zlib.compress(s)
+        if use_msgpack:
+            flag = bytes((flag[0] | FRAME_MSGPACK,))
+        b = flag + b
+        self._dumped = b
         return b
 
     def loads(self, b):
-        b = zlib.decompress(b)
-        d = json.loads(b.decode("utf8"))
+        d = _decode_payload(b)
+        self._set_payload(d)
+        return d
+
+    def _set_payload(self, d):
         self._name = d.get("n")
         self._data = d.get("d")
-        return d
+        self._dumped = None
+        self._str = None
 
     def parse(self):
         raise NotImplemented
 
-    def subscribe(self, callback, multi=False):
+    def subscribe(self, callback, multi=False, batch_size=1, batch_interval=CONSUME_BATCH_INTERVAL):
         """ Subscribe this event.
 
         Args:
             callback: Asynchronous callback function.
             multi: If subscribe multiple channels ?
+            batch_size: If greater than 1, callback will be invoked with a list of parsed objects, which holding
+                `batch_size` objects at most. It can't be used together with `multi`.
+            batch_interval: Max waiting time(seconds) before a batch is dispatched, only for `batch_size` > 1.
         """
         from quant.quant import quant
         self._callback = callback
-        SingleTask.run(quant.event_center.subscribe, self, self.callback, multi)
+        if batch_size > 1:
+            SingleTask.run(quant.event_center.subscribe, self, self.callback_batch, multi, batch_size, batch_interval)
+        else:
+            SingleTask.run(quant.event_center.subscribe, self, self.callback, multi)
 
     def publish(self):
         """Publish this event."""
         from quant.quant import quant
-        SingleTask.run(quant.event_center.publish, self)
+        quant.event_center.publish(self)
+
+    async def publish_now(self):
+        """Publish this event immediately, without waiting in the batch publish queue."""
+        from quant.quant import quant
+        await quant.event_center.publish_now(self)
 
     async def callback(self, channel, body, envelope, properties):
-        self._exchange = envelope.exchange_name
-        self._routing_key = envelope.routing_key
-        self.loads(body)
-        o = self.parse()
+        # Large payloads are decoded in thread pool, a later small message must wait for the previous messages, so
+        # that the callback is always invoked in the same order as messages are received.
+        prev, turn = self._turn, asyncio.get_event_loop().create_future()
+        self._turn = turn
+        try:
+            try:
+                if len(body) > DECODE_IN_EXECUTOR_SIZE:
+                    d = await asyncio.get_event_loop().run_in_executor(_DECODE_EXECUTOR, _decode_payload, body)
+                else:
+                    d = _decode_payload(body)
+            except ValueError as e:
+                logger.error("decode payload error, message dropped! exchange:", envelope.exchange_name,
+                             "routing_key:", envelope.routing_key, "error:", e, caller=self)
+                return
+            if prev and not prev.done():
+                await prev
+            self._exchange = envelope.exchange_name
+            self._routing_key = envelope.routing_key
+            self._set_payload(d)
+            o = self.parse()
+        finally:
+            turn.set_result(None)
         await self._callback(o)
 
+    async def callback_batch(self, messages):
+        """ Parse a batch of messages and invoke callback with the parsed objects list.
+
+        Args:
+            messages: Message list, e.g. [(body, envelope), ... ]
+        """
+        objs = []
+        for body, envelope in messages:
+            try:
+                d = _decode_payload(body)
+            except ValueError as e:
+                logger.error("decode payload error, message dropped! exchange:", envelope.exchange_name,
+                             "routing_key:", envelope.routing_key, "error:", e, caller=self)
+                continue
+            self._exchange = envelope.exchange_name
+            self._routing_key = envelope.routing_key
+            self._set_payload(d)
+            objs.append(self.parse())
+        if not objs:
+            return
+        await self._callback(objs)
+
     def __str__(self):
-        info = "EVENT: name={n}, exchange={e}, queue={q}, routing_key={r}, data={d}".format(
-            e=self.exchange, q=self.queue, r=self.routing_key, n=self.name, d=self.data)
-        return info
+        if self._str is None:
+            data = self.data if self.VERBOSE_STR else f"<len={len(self.data) if self.data else 0}>"
+            self._str = f"EVENT: name={self.name}, exchange={self.exchange}, queue={self.queue}, " \
+                        f"routing_key={self.routing_key}, data={data}"
+        return self._str
 
     def __repr__(self):
         return str(self)
@@ -138,12 +371,14 @@ class EventConfig(Event):
         Subscriber: Any Servers who need.
     """
 
+    __slots__ = ()
+
     def __init__(self, server_id=None, params=None):
         """Initialize."""
         name = "EVENT_CONFIG"
         exchange = "Config"
-        queue = "{server_id}.{exchange}".format(server_id=server_id, exchange=exchange)
-        routing_key = "{server_id}".format(server_id=server_id)
+        queue = _join_key2(server_id, exchange)
+        routing_key = f"{server_id}"
         data = {
             "server_id": server_id,
             "params": params
@@ -166,12 +401,14 @@ class EventHeartbeat(Event):
         Subscriber: Monitor server.
     """
 
+    __slots__ = ()
+
     def __init__(self, server_id=None, count=None):
         """Initialize."""
         name = "EVENT_HEARTBEAT"
         exchange = "Heartbeat"
-        queue = "{server_id}.{exchange}".format(server_id=server_id, exchange=exchange)
-        routing_key = "{server_id}".format(server_id=server_id)
+        queue = _join_key2(server_id, exchange)
+        routing_key = f"{server_id}"
         data = {
             "server_id": server_id,
             "count": count
@@ -197,14 +434,14 @@ class EventAsset(Event):
         Subscriber: Any servers.
     """
 
+    __slots__ = ()
+
     def __init__(self, platform=None, account=None, assets=None, timestamp=None, update=False):
         """Initialize."""
         name = "EVENT_ASSET"
         exchange = "Asset"
-        routing_key = "{platform}.{account}".format(platform=platform, account=account)
-        queue = "{server_id}.{exchange}.{routing_key}".format(server_id=config.server_id,
-                                                              exchange=exchange,
-                                                              routing_key=routing_key)
+        routing_key = _join_key2(platform, account)
+        queue = _join_key3(config.server_id, exchange, routing_key)
         data = {
             "platform": platform,
             "account": account,
@@ -243,16 +480,16 @@ class EventOrder(Event):
         Subscriber: Any Servers who need.
     """
 
+    __slots__ = ()
+
     def __init__(self, platform=None, account=None, strategy=None, order_no=None, symbol=None, action=None, price=None,
                  quantity=None, remain=None, status=None, avg_price=None, order_type=None, trade_type=None, ctime=None,
                  utime=None):
         """Initialize."""
         name = "EVENT_ORDER"
         exchange = "Order"
-        routing_key = "{platform}.{account}.{strategy}".format(platform=platform, account=account, strategy=strategy)
-        queue = "{server_id}.{exchange}.{routing_key}".format(server_id=config.server_id,
-                                                              exchange=exchange,
-                                                              routing_key=routing_key)
+        routing_key = _join_key3(platform, account, strategy)
+        queue = _join_key3(config.server_id, exchange, routing_key)
         data = {
             "platform": platform,
             "account": account,
@@ -298,34 +535,28 @@ class EventKline(Event):
         Subscriber: Any servers.
     """
 
+    __slots__ = ()
+
+    # Event name and exchange name for every kline type, e.g. {kline_type: (name, exchange)}
+    _KLINE_TYPES = {
+        const.MARKET_TYPE_KLINE: ("EVENT_KLINE", "Kline"),
+        const.MARKET_TYPE_KLINE_5M: ("EVENT_KLINE_5MIN", "Kline.5min"),
+        const.MARKET_TYPE_KLINE_15M: ("EVENT_KLINE_15MIN", "Kline.15min"),
+        const.MARKET_TYPE_KLINE_1H: ("EVENT_KLINE_1H", "Kline.1h"),
+        const.MARKET_TYPE_KLINE_4H: ("EVENT_KLINE_4H", "Kline.4h"),
+        const.MARKET_TYPE_KLINE_1DAY: ("EVENT_KLINE_1DAY", "Kline.1day"),
+    }
+
     def __init__(self, platform=None, symbol=None, open=None, high=None, low=None, close=None, volume=None,
                  timestamp=None, kline_type=None):
         """Initialize."""
-        if kline_type == const.MARKET_TYPE_KLINE:
-            name = "EVENT_KLINE"
-            exchange = "Kline"
-        elif kline_type == const.MARKET_TYPE_KLINE_5M:
-            name = "EVENT_KLINE_5MIN"
-            exchange = "Kline.5min"
-        elif kline_type == const.MARKET_TYPE_KLINE_15M:
-            name = "EVENT_KLINE_15MIN"
-            exchange = "Kline.15min"
-        elif kline_type == const.MARKET_TYPE_KLINE_1H:
-            name = "EVENT_KLINE_1H"
-            exchange = "Kline.1h"
-        elif kline_type == const.MARKET_TYPE_KLINE_4H:
-            name = "EVENT_KLINE_4H"
-            exchange = "Kline.4h"
-        elif kline_type == const.MARKET_TYPE_KLINE_1DAY:
-            name = "EVENT_KLINE_1DAY"
-            exchange = "Kline.1day"
-        else:
+        try:
+            name, exchange = self._KLINE_TYPES[kline_type]
+        except KeyError:
             logger.error("kline_type error! kline_type:", kline_type, caller=self)
             return
-        routing_key = "{platform}.{symbol}".format(platform=platform, symbol=symbol)
-        queue = "{server_id}.{exchange}.{routing_key}".format(server_id=config.server_id,
-                                                              exchange=exchange,
-                                                              routing_key=routing_key)
+        routing_key = _join_key2(platform, symbol)
+        queue = _join_key3(config.server_id, exchange, routing_key)
         data = {
             "platform": platform,
             "symbol": symbol,
@@ -340,7 +571,9 @@ class EventKline(Event):
         super(EventKline, self).__init__(name, exchange, queue, routing_key, data=data)
 
     def parse(self):
-        kline = Kline(**self.data)
+        d = self._data
+        kline = Kline(d["platform"], d["symbol"], d["open"], d["high"], d["low"], d["close"], d["volume"],
+                      d["timestamp"], d["kline_type"])
         return kline
 
 
@@ -359,14 +592,14 @@ class EventOrderbook(Event):
         Subscriber: Any servers.
     """
 
+    __slots__ = ()
+
     def __init__(self, platform=None, symbol=None, asks=None, bids=None, timestamp=None):
         """Initialize."""
         name = "EVENT_ORDERBOOK"
         exchange = "Orderbook"
-        routing_key = "{platform}.{symbol}".format(platform=platform, symbol=symbol)
-        queue = "{server_id}.{exchange}.{routing_key}".format(server_id=config.server_id,
-                                                              exchange=exchange,
-                                                              routing_key=routing_key)
+        routing_key = _join_key2(platform, symbol)
+        queue = _join_key3(config.server_id, exchange, routing_key)
         data = {
             "platform": platform,
             "symbol": symbol,
@@ -377,7 +610,8 @@ class EventOrderbook(Event):
         super(EventOrderbook, self).__init__(name, exchange, queue, routing_key, data=data)
 
     def parse(self):
-        orderbook = Orderbook(**self.data)
+        d = self._data
+        orderbook = Orderbook(d["platform"], d["symbol"], d["asks"], d["bids"], d["timestamp"])
         return orderbook
 
 
@@ -397,15 +631,15 @@ class EventTrade(Event):
         Subscriber: Any servers.
     """
 
+    __slots__ = ()
+
     def __init__(self, platform=None, symbol=None, action=None, price=None, quantity=None, timestamp=None):
         """ 初始化
         """
         name = "EVENT_TRADE"
         exchange = "Trade"
-        routing_key = "{platform}.{symbol}".format(platform=platform, symbol=symbol)
-        queue = "{server_id}.{exchange}.{routing_key}".format(server_id=config.server_id,
-                                                              exchange=exchange,
-                                                              routing_key=routing_key)
+        routing_key = _join_key2(platform, symbol)
+        queue = _join_key3(config.server_id, exchange, routing_key)
         data = {
             "platform": platform,
             "symbol": symbol,
@@ -417,7 +651,8 @@ class EventTrade(Event):
         super(EventTrade, self).__init__(name, exchange, queue, routing_key, data=data)
 
     def parse(self):
-        trade = Trade(**self.data)
+        d = self._data
+        trade = Trade(d["platform"], d["symbol"], d["action"], d["price"], d["quantity"], d["timestamp"])
         return trade
 
 
@@ -434,29 +669,41 @@ class EventCenter:
         self._channel = None  # Connection channel.
         self._connected = False  # If connect success.
         self._subscribers = []  # e.g. [(event, callback, multi), ...]
-        self._event_handler = {}  # e.g. {"exchange:routing_key": [callback_function, ...]}
+        self._event_handler = {}  # e.g. {(exchange, routing_key): [callback_function, ...]}
+        self._publish_queue = asyncio.Queue()  # Events waiting to be published.
 
         # Register a loop run task to check TCP connection's healthy.
         LoopRunTask.register(self._check_connection, 10)
 
+        # Start a background task to publish queued events in batches.
+        SingleTask.run(self._publish_loop)
+
     def initialize(self):
         asyncio.get_event_loop().run_until_complete(self.connect())
 
     @async_method_locker("EventCenter.subscribe")
-    async def subscribe(self, event: Event, callback=None, multi=False):
+    async def subscribe(self, event: Event, callback=None, multi=False, batch_size=1,
+                        batch_interval=CONSUME_BATCH_INTERVAL):
         """ Subscribe a event.
 
         Args:
             event: Event type.
             callback: Asynchronous callback.
             multi: If subscribe multiple channel(routing_key) ?
+            batch_size: If greater than 1, callback will be invoked with a list of `(body, envelope)` messages,
+                it can't be used together with `multi`.
+            batch_interval: Max waiting time(seconds) before a batch is dispatched.
         """
+        if multi and batch_size > 1:
+            logger.error("batch subscription is not supported for multi channels! NAME:", event.name, "EXCHANGE:",
+                         event.exchange, "ROUTING_KEY:", event.routing_key, caller=self)
+            return
         logger.info("NAME:", event.name, "EXCHANGE:", event.exchange, "QUEUE:", event.queue, "ROUTING_KEY:",
-                    event.routing_key, caller=self)
-        self._subscribers.append((event, callback, multi))
+                    event.routing_key, "BATCH_SIZE:", batch_size, caller=self)
+        self._subscribers.append((event, callback, multi, batch_size, batch_interval))
 
-    async def publish(self, event):
-        """ Publish a event.
+    def publish(self, event):
+        """ Publish a event, the event will be put into publish queue and sent in batch later.
 
         Args:
             event: A event to publish.
@@ -464,8 +711,58 @@ class EventCenter:
         if not self._connected:
             logger.warn("RabbitMQ not ready right now!", caller=self)
             return
-        data = event.dumps()
-        await self._channel.basic_publish(payload=data, exchange_name=event.exchange, routing_key=event.routing_key)
+        self._publish_queue.put_nowait(event)
+
+    async def publish_now(self, event):
+        """ Publish a event immediately, without waiting in the publish queue.
+
+        Args:
+            event: A event to publish.
+        """
+        if not self._connected:
+            logger.warn("RabbitMQ not ready right now!", caller=self)
+            return
+        await self._channel.basic_publish(payload=event.dumps(), exchange_name=event.exchange,
+                                          routing_key=event.routing_key)
+
+    async def _publish_loop(self):
+        """ Get events from publish queue and send them to RabbitMQ server in batches. If the connection is lost, the
+        unsent events are held and sent again after reconnected."""
+        events = []
+        while True:
+            if not events:
+                events.append(await self._publish_queue.get())
+                # Wait a moment for more events to come, unless some events are queued already.
+                if self._publish_queue.empty():
+                    await asyncio.sleep(PUBLISH_BATCH_INTERVAL)
+            while len(events) < PUBLISH_BATCH_SIZE and not self._publish_queue.empty():
+                events.append(self._publish_queue.get_nowait())
+            if not self._connected:
+                logger.warn("RabbitMQ not ready right now! pending events:", len(events), caller=self)
+                await asyncio.sleep(1)
+                continue
+            events = await self._publish_events(events)
+            if events:
+                await asyncio.sleep(1)
+
+    async def _publish_events(self, events):
+        """ Publish events one by one.
+
+        Args:
+            events: Events to publish.
+
+        Returns:
+            unsent: Events not sent because of the channel is closed, they should be published again later.
+        """
+        for i, event in enumerate(events):
+            try:
+                await self._channel.basic_publish(payload=event.dumps(), exchange_name=event.exchange,
+                                                  routing_key=event.routing_key)
+            except Exception as e:
+                logger.error("publish event error:", e, "event:", event, caller=self)
+                if not (self._channel and self._channel.is_open):
+                    return events[i:]
+        return []
 
     async def connect(self, reconnect=False):
         """ Connect to RabbitMQ server and create default exchange.
@@ -496,8 +793,10 @@ class EventCenter:
         # Create default exchanges.
         exchanges = ["Orderbook", "Trade", "Kline", "Kline.5min", "Kline.15min", "Kline.1h", "Kline.4h", "Kline.1day", "Config", "Heartbeat", "Asset",
                      "Order", ]
-        for name in exchanges:
-            await self._channel.exchange_declare(exchange_name=name, type_name="topic")
+        # Declare requests are pipelined without waiting for the replies, a failed declaration will close the
+        # channel and trigger a reconnection by `_check_connection`.
+        await asyncio.gather(*(self._channel.exchange_declare(exchange_name=name, type_name="topic", no_wait=True)
+                               for name in exchanges))
         logger.debug("create default exchanges success!", caller=self)
 
         if reconnect:
@@ -508,20 +807,30 @@ class EventCenter:
 
     def _bind_and_consume(self):
         async def do_them():
-            for event, callback, multi in self._subscribers:
-                await self._initialize(event, callback, multi)
+            for event, callback, multi, batch_size, batch_interval in self._subscribers:
+                await self._initialize(event, callback, multi, batch_size, batch_interval)
         SingleTask.run(do_them)
 
-    async def _initialize(self, event: Event, callback=None, multi=False):
+    async def _initialize(self, event: Event, callback=None, multi=False, batch_size=1,
+                          batch_interval=CONSUME_BATCH_INTERVAL):
+        # Batch subscription use a dedicated channel, so that the multiple ack won't touch other consumers' messages.
+        batch = callback and not multi and batch_size > 1
+        channel = await self._protocol.channel() if batch else self._channel
         if event.queue:
-            await self._channel.queue_declare(queue_name=event.queue, auto_delete=True)
+            await channel.queue_declare(queue_name=event.queue, auto_delete=True, no_wait=True)
             queue_name = event.queue
         else:
-            result = await self._channel.queue_declare(exclusive=True)
+            result = await channel.queue_declare(exclusive=True)
             queue_name = result["queue"]
-        await self._channel.queue_bind(queue_name=queue_name, exchange_name=event.exchange,
-                                       routing_key=event.routing_key)
-        await self._channel.basic_qos(prefetch_count=event.prefetch_count)
+        await channel.queue_bind(queue_name=queue_name, exchange_name=event.exchange, routing_key=event.routing_key,
+                                 no_wait=True)
+        if batch:
+            await channel.basic_qos(prefetch_count=max(event.prefetch_count, batch_size))
+            on_message = self._create_batch_consumer(callback, batch_size, batch_interval)
+            await channel.basic_consume(on_message, queue_name=queue_name)
+            logger.info("batch message queue:", queue_name, "batch size:", batch_size, caller=self)
+            return
+        await channel.basic_qos(prefetch_count=event.prefetch_count)
         if callback:
             if multi:
                 await self._channel.basic_consume(callback=callback, queue_name=queue_name, no_ack=True)
@@ -535,8 +844,7 @@ class EventCenter:
         # logger.debug("exchange:", envelope.exchange_name, "routing_key:", envelope.routing_key,
         #              "body:", body, caller=self)
         try:
-            key = "{exchange}:{routing_key}".format(exchange=envelope.exchange_name, routing_key=envelope.routing_key)
-            funcs = self._event_handler[key]
+            funcs = self._event_handler[(envelope.exchange_name, envelope.routing_key)]
             for func in funcs:
                 SingleTask.run(func, channel, body, envelope, properties)
         except:
@@ -545,8 +853,67 @@ class EventCenter:
         finally:
             await self._channel.basic_client_ack(delivery_tag=envelope.delivery_tag)  # response ack
 
+    def _create_batch_consumer(self, callback, batch_size, batch_interval):
+        """ Create a consumer function, which collecting messages and invoking callback with a batch of messages.
+        All messages in a batch will be acknowledged by one multiple ack after the callback finished, if the callback
+        failed, the batch will be requeued once.
+
+        Args:
+            callback: Asynchronous callback, e.g. async def callback(messages): pass
+            batch_size: Max messages in a batch.
+            batch_interval: Max waiting time(seconds) before a batch is dispatched.
+
+        Returns:
+            on_message: Consumer function.
+        """
+        pending = []  # e.g. [(body, envelope), ... ]
+        timer = None
+        # Batches are dispatched one by one, so that a multiple ack won't acknowledge a batch still in processing.
+        lock = asyncio.Lock()
+
+        async def dispatch(channel, messages):
+            delivery_tag = messages[-1][1].delivery_tag
+            async with lock:
+                try:
+                    await callback(messages)
+                except Exception as e:
+                    # Requeue the batch only if it is not redelivered, so that a bad message won't loop forever.
+                    requeue = not any(envelope.is_redeliver for _, envelope in messages)
+                    logger.error("batch callback error! messages:", len(messages), "requeue:", requeue, "error:", e,
+                                 caller=self)
+                    try:
+                        await channel.basic_client_nack(delivery_tag=delivery_tag, multiple=True, requeue=requeue)
+                    except Exception as e:
+                        logger.error("nack batch messages error:", e, caller=self)
+                    return
+                try:
+                    await channel.basic_client_ack(delivery_tag=delivery_tag, multiple=True)
+                except Exception as e:
+                    logger.error("ack batch messages error:", e, caller=self)
+
+        async def flush(channel):
+            nonlocal timer
+            if timer:
+                timer.cancel()
+                timer = None
+            if not pending:
+                return
+            messages = pending[:]
+            pending.clear()
+            SingleTask.run(dispatch, channel, messages)
+
+        async def on_message(channel, body, envelope, properties):
+            nonlocal timer
+            pending.append((body, envelope))
+            if len(pending) >= batch_size:
+                await flush(channel)
+            elif not timer:
+                timer = asyncio.get_event_loop().call_later(batch_interval, SingleTask.run, flush, channel)
+
+        return on_message
+
     def _add_event_handler(self, event: Event, callback):
-        key = "{exchange}:{routing_key}".format(exchange=event.exchange, routing_key=event.routing_key)
+        key = (sys.intern(event.exchange), sys.intern(event.routing_key))
         if key in self._event_handler:
             self._event_handler[key].append(callback)
         else:
@@ -555,7 +922,8 @@ class EventCenter:
 
     async def _check_connection(self, *args, **kwargs):
         if self._connected and self._channel and self._channel.is_open:
-            logger.debug("RabbitMQ connection ok.", caller=self)
+            if logger.debug_enabled():
+                logger.debug("RabbitMQ connection ok.", caller=self)
             return
         logger.error("CONNECTION LOSE! START RECONNECT RIGHT NOW!", caller=self)
         self._connected = False
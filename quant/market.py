@@ -8,7 +8,14 @@ Date:   2019/02/16
 Email:  huangtao@ifclover.com
 """
 
-import json
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
+    _json_dumps = json.dumps
 
 from quant import const
 from quant.utils import logger
@@ -23,30 +30,109 @@ class Orderbook:
         asks: Asks list, e.g. [[price, quantity], [...], ...]
         bids: Bids list, e.g. [[price, quantity], [...], ...]
         timestamp: Update time, millisecond.
+
+    * NOTE:
+        Orderbook object is a read-only snapshot, all fields are read-only properties, so that `data` and string
+        form can be cached after first access.
     """
 
+    __slots__ = ("_platform", "_symbol", "_asks", "_bids", "_timestamp", "_data", "_str", "_asks_soa", "_bids_soa")
+
     def __init__(self, platform=None, symbol=None, asks=None, bids=None, timestamp=None):
         """ Initialize. """
-        self.platform = platform
-        self.symbol = symbol
-        self.asks = asks
-        self.bids = bids
-        self.timestamp = timestamp
+        self._platform = platform
+        self._symbol = symbol
+        self._asks = asks
+        self._bids = bids
+        self._timestamp = timestamp
+        self._data = None  # Cached data dict.
+        self._str = None  # Cached json string.
+        self._asks_soa = None  # Cached asks numpy arrays, (prices, quantities).
+        self._bids_soa = None  # Cached bids numpy arrays, (prices, quantities).
+
+    @property
+    def platform(self):
+        return self._platform
+
+    @property
+    def symbol(self):
+        return self._symbol
+
+    @property
+    def asks(self):
+        return self._asks
+
+    @property
+    def bids(self):
+        return self._bids
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def ask_prices(self):
+        """Ask prices, float64 numpy array. numpy is required."""
+        return self._get_asks_soa()[0]
+
+    @property
+    def ask_quantities(self):
+        """Ask quantities, float64 numpy array. numpy is required."""
+        return self._get_asks_soa()[1]
+
+    @property
+    def bid_prices(self):
+        """Bid prices, float64 numpy array. numpy is required."""
+        return self._get_bids_soa()[0]
+
+    @property
+    def bid_quantities(self):
+        """Bid quantities, float64 numpy array. numpy is required."""
+        return self._get_bids_soa()[1]
+
+    def _get_asks_soa(self):
+        if self._asks_soa is None:
+            from quant.market_fast import split_levels
+            self._asks_soa = split_levels(self.asks)
+        return self._asks_soa
+
+    def _get_bids_soa(self):
+        if self._bids_soa is None:
+            from quant.market_fast import split_levels
+            self._bids_soa = split_levels(self.bids)
+        return self._bids_soa
 
     @property
     def data(self):
-        d = {
-            "platform": self.platform,
-            "symbol": self.symbol,
-            "asks": self.asks,
-            "bids": self.bids,
-            "timestamp": self.timestamp
-        }
-        return d
+        if self._data is None:
+            self._data = {
+                "platform": self.platform,
+                "symbol": self.symbol,
+                "asks": self.asks,
+                "bids": self.bids,
+                "timestamp": self.timestamp
+            }
+        return self._data
+
+    def to_numpy(self, n_levels, out=None):
+        """ Convert the top `n_levels` levels to float64 numpy arrays, missing levels are filled with NaN.
+
+        Args:
+            n_levels: Levels count.
+            out: Pre-allocated arrays `(bid_prices, bid_quantities, ask_prices, ask_quantities)`.
+
+        Returns:
+            (bid_prices, bid_quantities, ask_prices, ask_quantities)
+
+        * NOTE: numpy is required.
+        """
+        from quant.market_fast import flatten_book
+        return flatten_book(self.asks, self.bids, n_levels, out)
 
     def __str__(self):
-        info = json.dumps(self.data)
-        return info
+        if self._str is None:
+            self._str = _json_dumps(self.data)
+        return self._str
 
     def __repr__(self):
         return str(self)
@@ -62,32 +148,66 @@ class Trade:
         price: Order place price.
         quantity: Order place quantity.
         timestamp: Update time, millisecond.
+
+    * NOTE:
+        Trade object is a read-only snapshot, all fields are read-only properties, so that `data` and string
+        form can be cached after first access.
     """
 
+    __slots__ = ("_platform", "_symbol", "_action", "_price", "_quantity", "_timestamp", "_data", "_str")
+
     def __init__(self, platform=None, symbol=None, action=None, price=None, quantity=None, timestamp=None):
         """ Initialize. """
-        self.platform = platform
-        self.symbol = symbol
-        self.action = action
-        self.price = price
-        self.quantity = quantity
-        self.timestamp = timestamp
+        self._platform = platform
+        self._symbol = symbol
+        self._action = action
+        self._price = price
+        self._quantity = quantity
+        self._timestamp = timestamp
+        self._data = None  # Cached data dict.
+        self._str = None  # Cached json string.
+
+    @property
+    def platform(self):
+        return self._platform
+
+    @property
+    def symbol(self):
+        return self._symbol
+
+    @property
+    def action(self):
+        return self._action
+
+    @property
+    def price(self):
+        return self._price
+
+    @property
+    def quantity(self):
+        return self._quantity
+
+    @property
+    def timestamp(self):
+        return self._timestamp
 
     @property
     def data(self):
-        d = {
-            "platform": self.platform,
-            "symbol": self.symbol,
-            "action": self.action,
-            "price": self.price,
-            "quantity": self.quantity,
-            "timestamp": self.timestamp
-        }
-        return d
+        if self._data is None:
+            self._data = {
+                "platform": self.platform,
+                "symbol": self.symbol,
+                "action": self.action,
+                "price": self.price,
+                "quantity": self.quantity,
+                "timestamp": self.timestamp
+            }
+        return self._data
 
     def __str__(self):
-        info = json.dumps(self.data)
-        return info
+        if self._str is None:
+            self._str = _json_dumps(self.data)
+        return self._str
 
     def __repr__(self):
         return str(self)
@@ -106,39 +226,86 @@ class Kline:
         volume: Total trade volume.
         timestamp: Update time, millisecond.
         kline_type: Kline type name, kline - 1min, kline_5min - 5min, kline_15min - 15min.
+
+    * NOTE:
+        Kline object is a read-only snapshot, all fields are read-only properties, so that `data` and string
+        form can be cached after first access.
     """
 
+    __slots__ = ("_platform", "_symbol", "_open", "_high", "_low", "_close", "_volume", "_timestamp", "_kline_type",
+                 "_data", "_str")
+
     def __init__(self, platform=None, symbol=None, open=None, high=None, low=None, close=None, volume=None,
                  timestamp=None, kline_type=None):
         """ Initialize. """
-        self.platform = platform
-        self.symbol = symbol
-        self.open = open
-        self.high = high
-        self.low = low
-        self.close = close
-        self.volume = volume
-        self.timestamp = timestamp
-        self.kline_type = kline_type
+        self._platform = platform
+        self._symbol = symbol
+        self._open = open
+        self._high = high
+        self._low = low
+        self._close = close
+        self._volume = volume
+        self._timestamp = timestamp
+        self._kline_type = kline_type
+        self._data = None  # Cached data dict.
+        self._str = None  # Cached json string.
+
+    @property
+    def platform(self):
+        return self._platform
+
+    @property
+    def symbol(self):
+        return self._symbol
+
+    @property
+    def open(self):
+        return self._open
+
+    @property
+    def high(self):
+        return self._high
+
+    @property
+    def low(self):
+        return self._low
+
+    @property
+    def close(self):
+        return self._close
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @property
+    def timestamp(self):
+        return self._timestamp
+
+    @property
+    def kline_type(self):
+        return self._kline_type
 
     @property
     def data(self):
-        d = {
-            "platform": self.platform,
-            "symbol": self.symbol,
-            "open": self.open,
-            "high": self.high,
-            "low": self.low,
-            "close": self.close,
-            "volume": self.volume,
-            "timestamp": self.timestamp,
-            "kline_type": self.kline_type
-        }
-        return d
+        if self._data is None:
+            self._data = {
+                "platform": self.platform,
+                "symbol": self.symbol,
+                "open": self.open,
+                "high": self.high,
+                "low": self.low,
+                "close": self.close,
+                "volume": self.volume,
+                "timestamp": self.timestamp,
+                "kline_type": self.kline_type
+            }
+        return self._data
 
     def __str__(self):
-        info = json.dumps(self.data)
-        return info
+        if self._str is None:
+            self._str = _json_dumps(self.data)
+        return self._str
 
     def __repr__(self):
         return str(self)
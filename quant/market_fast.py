@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+
+"""
+Fast market data helpers, convert market data to numpy arrays.
+
+* NOTE: This module requires `numpy`, and `numba` is used to compile the hot loops if installed.
+
+Author: HuangTao
+Date:   2019/08/28
+Email:  huangtao@ifclover.com
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+__all__ = ("flatten_book", "split_levels", )
+
+
+def _fill_side(levels, n, px, qty):
+    """ Copy the top `n` levels into price and quantity arrays, missing levels are filled with NaN.
+
+    Args:
+        levels: Orderbook levels, 2-D float64 array, e.g. [[price, quantity], ... ]
+        n: Levels count.
+        px: Price array to be filled.
+        qty: Quantity array to be filled.
+    """
+    m = min(n, levels.shape[0])
+    for i in range(m):
+        px[i] = levels[i, 0]
+        qty[i] = levels[i, 1]
+    for i in range(m, n):
+        px[i] = np.nan
+        qty[i] = np.nan
+
+
+def _fill_side_numpy(levels, n, px, qty):
+    """ Same as `_fill_side`, vectorized by numpy, used if numba is not installed."""
+    m = min(n, levels.shape[0])
+    px[:m] = levels[:m, 0]
+    qty[:m] = levels[:m, 1]
+    px[m:n] = np.nan
+    qty[m:n] = np.nan
+
+
+# Explicit signature makes numba compile eagerly at import time (and reuse the on-disk cache), so the first
+# orderbook update does not pay the JIT compilation cost.
+_FILL_SIDE_SIGNATURE = "void(float64[:, :], int64, float64[:], float64[:])"
+
+if njit:
+    _fill_side = njit(_FILL_SIDE_SIGNATURE, cache=True)(_fill_side)
+else:
+    _fill_side = _fill_side_numpy
+
+
+def _to_levels(levels):
+    """ Convert orderbook levels list to a 2-D float64 array."""
+    return np.asarray(levels or (), dtype=np.float64).reshape(-1, 2)
+
+
+def flatten_book(asks, bids, n, out=None):
+    """ Flatten the top `n` levels of orderbook into contiguous float64 arrays.
+
+    Args:
+        asks: Asks list, e.g. [[price, quantity], [...], ...]
+        bids: Bids list, e.g. [[price, quantity], [...], ...]
+        n: Levels count.
+        out: Pre-allocated arrays `(bid_prices, bid_quantities, ask_prices, ask_quantities)`, every array's length
+            must be >= n. If None, new arrays will be allocated.
+
+    Returns:
+        bp: Bid prices.
+        bv: Bid quantities.
+        ap: Ask prices.
+        av: Ask quantities.
+    """
+    if out is None:
+        out = tuple(np.empty(n, dtype=np.float64) for _ in range(4))
+    bp, bv, ap, av = out
+    _fill_side(_to_levels(bids), n, bp, bv)
+    _fill_side(_to_levels(asks), n, ap, av)
+    return bp, bv, ap, av
+
+
+def split_levels(levels):
+    """ Split orderbook levels into contiguous price and quantity arrays (structure of arrays).
+
+    Args:
+        levels: Orderbook levels, e.g. [[price, quantity], [...], ...]
+
+    Returns:
+        prices: Price array, float64.
+        quantities: Quantity array, float64.
+    """
+    arr = _to_levels(levels)
+    return np.ascontiguousarray(arr[:, 0]), np.ascontiguousarray(arr[:, 1])
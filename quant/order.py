@@ -56,6 +56,9 @@ class Order:
         utime: Order update time, millisecond.
     """
 
+    __slots__ = ("platform", "account", "strategy", "order_no", "action", "order_type", "symbol", "price", "quantity",
+                 "remain", "status", "avg_price", "trade_type", "ctime", "utime")
+
     def __init__(self, account=None, platform=None, strategy=None, order_no=None, symbol=None, action=None, price=0,
                  quantity=0, remain=0, status=ORDER_STATUS_NONE, avg_price=0, order_type=ORDER_TYPE_LIMIT,
                  trade_type=TRADE_TYPE_NONE, ctime=None, utime=None):
@@ -72,8 +75,12 @@ class Order:
         self.status = status
         self.avg_price = avg_price
         self.trade_type = trade_type
-        self.ctime = ctime if ctime else tools.get_cur_timestamp_ms()
-        self.utime = utime if utime else tools.get_cur_timestamp_ms()
+        if not ctime or not utime:
+            now = tools.get_cur_timestamp_ms()
+            ctime = ctime or now
+            utime = utime or now
+        self.ctime = ctime
+        self.utime = utime
 
     def __str__(self):
         info = "[platform: {platform}, account: {account}, strategy: {strategy}, order_no: {order_no}, " \
@@ -86,5 +93,12 @@ class Order:
             trade_type=self.trade_type, ctime=self.ctime, utime=self.utime)
         return info
 
+    def __copy__(self):
+        """Shallow copy, the generic `copy.copy` protocol is slow for slotted objects."""
+        order = Order.__new__(self.__class__)
+        for name in Order.__slots__:
+            setattr(order, name, getattr(self, name))
+        return order
+
     def __repr__(self):
         return str(self)
@@ -9,11 +9,21 @@ Date:   2018/08/09
 Email:  huangtao@ifclover.com
 """
 
-import json
 import copy
 import hmac
+import asyncio
 import hashlib
-from urllib.parse import urljoin
+from types import MappingProxyType
+from urllib.parse import urljoin, urlencode
+
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
+    _json_dumps = json.dumps
 
 from quant.error import Error
 from quant.utils import tools
@@ -24,7 +34,6 @@ from quant.utils.websocket import Websocket
 from quant.asset import Asset, AssetSubscribe
 from quant.tasks import SingleTask, LoopRunTask
 from quant.utils.http_client import AsyncHttpRequests
-from quant.utils.decorator import async_method_locker
 from quant.order import ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET
 from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED, \
     ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED
@@ -33,6 +42,42 @@ from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORD
 __all__ = ("BinanceRestAPI", "BinanceTrade", )
 
 
+# Max concurrent requests when revoking multiple orders.
+REVOKE_ORDER_CONCURRENCY = 8
+
+# Binance order status to our order status.
+_STATUS_MAP = {
+    "NEW": ORDER_STATUS_SUBMITTED,
+    "PARTIALLY_FILLED": ORDER_STATUS_PARTIAL_FILLED,
+    "FILLED": ORDER_STATUS_FILLED,
+    "CANCELED": ORDER_STATUS_CANCELED,
+    "REJECTED": ORDER_STATUS_FAILED,
+    "EXPIRED": ORDER_STATUS_FAILED
+}
+
+
+def _remain_quantity(quantity, executed):
+    """ Calculate remain quantity `quantity - executed` by fixed-point integer arithmetic, so there is no float
+    rounding error, e.g. "0.3" - "0.1" = 0.2 (not 0.19999999999999998).
+
+    Args:
+        quantity: Order quantity string, e.g. "1.00000000".
+        executed: Executed quantity string, e.g. "0.10000000".
+
+    Returns:
+        remain: Remain quantity, float.
+    """
+    q_int, _, q_frac = quantity.partition(".")
+    e_int, _, e_frac = executed.partition(".")
+    n = len(q_frac)
+    if len(e_frac) != n:  # Binance uses the same precision for both fields, pad if not.
+        n = max(n, len(e_frac))
+        q_frac = q_frac.ljust(n, "0")
+        e_frac = e_frac.ljust(n, "0")
+    remain = int(q_int + q_frac) - int(e_int + e_frac)
+    return remain / 10 ** n if n else float(remain)
+
+
 class BinanceRestAPI:
     """ Binance REST API client.
 
@@ -47,6 +92,8 @@ class BinanceRestAPI:
         self._host = host
         self._access_key = access_key
         self._secret_key = secret_key
+        self._hmac = hmac.new(secret_key.encode(), digestmod=hashlib.sha256)  # Copied for every signature.
+        self._headers = {"X-MBX-APIKEY": access_key}
 
     async def get_user_account(self):
         """ Get user account information.
@@ -137,7 +184,7 @@ class BinanceRestAPI:
             "price": price,
             "recvWindow": "5000",
             "newOrderRespType": "FULL",
-            "timestamp": tools.get_cur_timestamp_ms()
+            "timestamp": str(tools.get_cur_timestamp_ms())
         }
         success, error = await self.request("POST", "/api/v3/order", body=info, auth=True)
         return success, error
@@ -279,19 +326,18 @@ class BinanceRestAPI:
         if body:
             data.update(body)
 
-        if data:
-            query = "&".join(["=".join([str(k), str(v)]) for k, v in data.items()])
-        else:
-            query = ""
+        query = urlencode(data) if data else ""
         if auth and query:
-            signature = hmac.new(self._secret_key.encode(), query.encode(), hashlib.sha256).hexdigest()
-            query += "&signature={s}".format(s=signature)
+            h = self._hmac.copy()
+            h.update(query.encode("ascii"))  # urlencode output is pure ASCII.
+            query += "&signature=" + h.hexdigest()
         if query:
             url += ("?" + query)
 
-        if not headers:
-            headers = {}
-        headers["X-MBX-APIKEY"] = self._access_key
+        if headers:
+            headers.update(self._headers)
+        else:
+            headers = self._headers
         _, success, error = await AsyncHttpRequests.fetch(method, url, headers=headers, timeout=10, verify_ssl=False)
         return success, error
 
@@ -360,6 +406,7 @@ class BinanceTrade(Websocket):
         self._listen_key = None  # Listen key for Websocket authentication.
         self._assets = {}  # Asset data. e.g. {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }
         self._orders = {}  # Order data. e.g. {order_no: order, ... }
+        self._orders_view = MappingProxyType(self._orders)  # Read-only view of order data.
 
         # Initialize our REST API client.
         self._rest_api = BinanceRestAPI(self._host, self._access_key, self._secret_key)
@@ -376,11 +423,13 @@ class BinanceTrade(Websocket):
 
     @property
     def assets(self):
-        return copy.copy(self._assets)
+        """Asset snapshot, it's replaced on every update, DO NOT modify it."""
+        return self._assets
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        """Read-only view of order data, copy it if you want a snapshot."""
+        return self._orders_view
 
     @property
     def rest_api(self):
@@ -421,43 +470,25 @@ class BinanceTrade(Websocket):
             if self._init_success_callback:
                 SingleTask.run(self._init_success_callback, False, e)
             return
+        orders = self._orders
+        platform, account, strategy, symbol = self._platform, self._account, self._strategy, self._symbol
+        callback = self._order_update_callback
         for order_info in order_infos:
-            order_no = "{}_{}".format(order_info["orderId"], order_info["clientOrderId"])
-            if order_info["status"] == "NEW":
-                status = ORDER_STATUS_SUBMITTED
-            elif order_info["status"] == "PARTIALLY_FILLED":
-                status = ORDER_STATUS_PARTIAL_FILLED
-            elif order_info["status"] == "FILLED":
-                status = ORDER_STATUS_FILLED
-            elif order_info["status"] == "CANCELED":
-                status = ORDER_STATUS_CANCELED
-            elif order_info["status"] == "REJECTED":
-                status = ORDER_STATUS_FAILED
-            elif order_info["status"] == "EXPIRED":
-                status = ORDER_STATUS_FAILED
-            else:
+            order_no = f"{order_info['orderId']}_{order_info['clientOrderId']}"
+            status = _STATUS_MAP.get(order_info["status"])
+            if status is None:
                 logger.warn("unknown status:", order_info, caller=self)
                 continue
 
-            info = {
-                "platform": self._platform,
-                "account": self._account,
-                "strategy": self._strategy,
-                "order_no": order_no,
-                "action": order_info["side"],
-                "order_type": order_info["type"],
-                "symbol": self._symbol,
-                "price": order_info["price"],
-                "quantity": order_info["origQty"],
-                "remain": float(order_info["origQty"]) - float(order_info["executedQty"]),
-                "status": status,
-                "ctime": order_info["time"],
-                "utime": order_info["updateTime"]
-            }
-            order = Order(**info)
-            self._orders[order_no] = order
-            if self._order_update_callback:
-                SingleTask.run(self._order_update_callback, copy.copy(order))
+            quantity = order_info["origQty"]
+            order = Order(platform=platform, account=account, strategy=strategy, order_no=order_no,
+                          action=order_info["side"], order_type=order_info["type"], symbol=symbol,
+                          price=order_info["price"], quantity=quantity,
+                          remain=_remain_quantity(quantity, order_info["executedQty"]), status=status,
+                          ctime=order_info["time"], utime=order_info["updateTime"])
+            orders[order_no] = order
+            if callback:
+                SingleTask.run(callback, copy.copy(order))
 
         if self._init_success_callback:
             SingleTask.run(self._init_success_callback, True, None)
@@ -480,7 +511,7 @@ class BinanceTrade(Websocket):
         result, error = await self._rest_api.create_order(action, self._raw_symbol, price, quantity)
         if error:
             return None, error
-        order_no = "{}_{}".format(result["orderId"], result["clientOrderId"])
+        order_no = f"{result['orderId']}_{result['clientOrderId']}"
         return order_no, None
 
     async def revoke_order(self, *order_nos):
@@ -499,16 +530,15 @@ class BinanceTrade(Websocket):
             order_infos, error = await self._rest_api.get_open_orders(self._raw_symbol)
             if error:
                 return False, error
-            for order_info in order_infos:
-                _, error = await self._rest_api.revoke_order(self._raw_symbol, order_info["orderId"],
-                                                             order_info["clientOrderId"])
-                if error:
-                    return False, error
+            ids = [(order_info["orderId"], order_info["clientOrderId"]) for order_info in order_infos]
+            for e in await self._revoke_orders(ids):
+                if e:
+                    return False, e
             return True, None
 
         # If len(order_nos) == 1, you will cancel an order.
         if len(order_nos) == 1:
-            order_id, client_order_id = order_nos[0].split("_")
+            order_id, client_order_id = order_nos[0].split("_", 1)
             success, error = await self._rest_api.revoke_order(self._raw_symbol, order_id, client_order_id)
             if error:
                 return order_nos[0], error
@@ -518,15 +548,34 @@ class BinanceTrade(Websocket):
         # If len(order_nos) > 1, you will cancel multiple orders.
         if len(order_nos) > 1:
             success, error = [], []
-            for order_no in order_nos:
-                order_id, client_order_id = order_no.split("_")
-                _, e = await self._rest_api.revoke_order(self._raw_symbol, order_id, client_order_id)
+            errors = await self._revoke_orders([order_no.split("_", 1) for order_no in order_nos])
+            for order_no, e in zip(order_nos, errors):
                 if e:
                     error.append((order_no, e))
                 else:
                     success.append(order_no)
             return success, error
 
+    async def _revoke_orders(self, ids):
+        """ Revoke multiple orders concurrently, at most `REVOKE_ORDER_CONCURRENCY` requests in flight.
+
+        Args:
+            ids: Order id list, e.g. [(order_id, client_order_id), ... ]
+
+        Returns:
+            errors: Error information list for each order, None if revoked successfully.
+        """
+        semaphore = asyncio.Semaphore(REVOKE_ORDER_CONCURRENCY)
+
+        async def revoke(order_id, client_order_id):
+            async with semaphore:
+                _, error = await self._rest_api.revoke_order(self._raw_symbol, order_id, client_order_id)
+                return error
+
+        results = await asyncio.gather(*(revoke(order_id, client_order_id) for order_id, client_order_id in ids),
+                                       return_exceptions=True)
+        return results
+
     async def get_open_order_nos(self):
         """ Get open order no list.
         """
@@ -536,60 +585,66 @@ class BinanceTrade(Websocket):
         else:
             order_nos = []
             for order_info in success:
-                order_no = "{}_{}".format(order_info["orderId"], order_info["clientOrderId"])
+                order_no = f"{order_info['orderId']}_{order_info['clientOrderId']}"
                 order_nos.append(order_no)
             return order_nos, None
 
-    @async_method_locker("BinanceTrade.process.locker")
     async def process(self, msg):
         """ Process message that received from Websocket connection.
 
         Args:
             msg: message received from Websocket connection.
         """
-        logger.debug("msg:", json.dumps(msg), caller=self)
+        self._process_msg(msg)
+
+    async def process_batch(self, msgs):
+        """ Process a batch of messages that received from Websocket connection, in a plain loop.
+
+        Args:
+            msgs: Message list, in received order.
+        """
+        for msg in msgs:
+            try:
+                self._process_msg(msg)
+            except Exception as e:
+                logger.exception("process msg error:", e, "msg:", msg, caller=self)
+
+    def _process_msg(self, msg):
+        """ Process a message that received from Websocket connection.
+
+        Args:
+            msg: message received from Websocket connection.
+
+        * NOTE: Messages are dispatched one by one by `Websocket`, and this method is synchronous, so it needs no
+            locker.
+        """
+        if logger.debug_enabled():
+            logger.debug("msg:", _json_dumps(msg), caller=self)
         e = msg.get("e")
         if e == "executionReport":  # Order update.
             if msg["s"] != self._raw_symbol:
                 return
-            order_no = "{}_{}".format(msg["i"], msg["c"])
-            if msg["X"] == "NEW":
-                status = ORDER_STATUS_SUBMITTED
-            elif msg["X"] == "PARTIALLY_FILLED":
-                status = ORDER_STATUS_PARTIAL_FILLED
-            elif msg["X"] == "FILLED":
-                status = ORDER_STATUS_FILLED
-            elif msg["X"] == "CANCELED":
-                status = ORDER_STATUS_CANCELED
-            elif msg["X"] == "REJECTED":
-                status = ORDER_STATUS_FAILED
-            elif msg["X"] == "EXPIRED":
-                status = ORDER_STATUS_FAILED
-            else:
+            order_no = f"{msg['i']}_{msg['c']}"
+            status = _STATUS_MAP.get(msg["X"])
+            if status is None:
                 logger.warn("unknown status:", msg, caller=self)
                 return
             order = self._orders.get(order_no)
             if not order:
-                info = {
-                    "platform": self._platform,
-                    "account": self._account,
-                    "strategy": self._strategy,
-                    "order_no": order_no,
-                    "action": msg["S"],
-                    "order_type": msg["o"],
-                    "symbol": self._symbol,
-                    "price": msg["p"],
-                    "quantity": msg["q"],
-                    "ctime": msg["O"]
-                }
-                order = Order(**info)
+                order = Order(platform=self._platform, account=self._account, strategy=self._strategy,
+                              order_no=order_no, action=msg["S"], order_type=msg["o"], symbol=self._symbol,
+                              price=msg["p"], quantity=msg["q"], ctime=msg["O"])
                 self._orders[order_no] = order
-            order.remain = float(msg["q"]) - float(msg["z"])
+            order.remain = _remain_quantity(msg["q"], msg["z"])
             order.status = status
             order.utime = msg["T"]
             if self._order_update_callback:
                 SingleTask.run(self._order_update_callback, copy.copy(order))
 
+            # Delete order that already completed.
+            if status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
+                self._orders.pop(order_no)
+
     async def on_event_asset_update(self, asset: Asset):
         """ Asset data update callback.
 
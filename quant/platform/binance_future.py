@@ -9,11 +9,21 @@ Date:   2019/09/18
 Email:  huangtao@ifclover.com
 """
 
-import json
+import sys
 import copy
 import hmac
-import hashlib
-from urllib.parse import urljoin
+import random
+import asyncio
+from urllib.parse import urljoin, urlencode
+
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
+    _json_dumps = json.dumps
 
 from quant.error import Error
 from quant.utils import tools
@@ -25,15 +35,77 @@ from quant.utils.web import Websocket
 from quant.asset import Asset, AssetSubscribe
 from quant.tasks import SingleTask, LoopRunTask
 from quant.utils.http_client import AsyncHttpRequests
-from quant.utils.decorator import async_method_locker
 from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL, ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET
 from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED, \
     ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED
-from quant.order import TRADE_TYPE_BUY_OPEN, TRADE_TYPE_SELL_OPEN, TRADE_TYPE_SELL_CLOSE, TRADE_TYPE_BUY_CLOSE
+from quant.order import TRADE_TYPE_NONE, TRADE_TYPE_BUY_OPEN, TRADE_TYPE_SELL_OPEN, TRADE_TYPE_SELL_CLOSE, \
+    TRADE_TYPE_BUY_CLOSE
 
 
 __all__ = ("BinanceFutureRestAPI", "BinanceFutureTrade", )
 
+# Max concurrent requests when revoking multiple orders.
+REVOKE_ORDER_CONCURRENCY = 10
+
+# Interval(seconds) of polling position information, position updates are pushed by `ACCOUNT_UPDATE` message,
+# polling is just a fallback.
+POSITION_CHECK_INTERVAL = 60
+
+# Binance Future order side and type to our constant strings, so that every order shares the same string objects
+# instead of holding the copies parsed from each message.
+_ACTION_MAP = {
+    "BUY": ORDER_ACTION_BUY,
+    "SELL": ORDER_ACTION_SELL
+}
+_ORDER_TYPE_MAP = {
+    "LIMIT": ORDER_TYPE_LIMIT,
+    "MARKET": ORDER_TYPE_MARKET
+}
+
+# Binance Future order status to our order status.
+_STATUS_MAP = {
+    "NEW": ORDER_STATUS_SUBMITTED,
+    "PARTIALLY_FILLED": ORDER_STATUS_PARTIAL_FILLED,
+    "PARTIAL_FILLED": ORDER_STATUS_PARTIAL_FILLED,
+    "FILLED": ORDER_STATUS_FILLED,
+    "CANCELED": ORDER_STATUS_CANCELED,
+    "REJECTED": ORDER_STATUS_FAILED,
+    "EXPIRED": ORDER_STATUS_FAILED
+}
+
+
+def _remain_quantity(quantity, executed, status):
+    """ Calculate remain quantity, skip parsing the quantity strings if the result is obvious.
+
+    Args:
+        quantity: Order quantity string.
+        executed: Executed quantity string.
+        status: Order status.
+
+    Returns:
+        remain: Remain quantity, float.
+    """
+    if status == ORDER_STATUS_FILLED:
+        return 0.0
+    if executed == "0":  # Nothing filled yet.
+        return float(quantity)
+    return float(quantity) - float(executed)
+
+
+def _trade_type(client_order_id):
+    """ Get trade type from the last digit of client order id.
+
+    Args:
+        client_order_id: Client order id.
+
+    Returns:
+        trade_type: Trade type, TRADE_TYPE_NONE if the last character of client order id is not a digit.
+    """
+    c = client_order_id[-1:]
+    if not c.isdigit():
+        return TRADE_TYPE_NONE
+    return ord(c) - 48
+
 
 class BinanceFutureRestAPI:
     """ Binance Future REST API client.
@@ -49,6 +121,8 @@ class BinanceFutureRestAPI:
         self._host = host
         self._access_key = access_key
         self._secret_key = secret_key
+        self._hmac = hmac.new(secret_key.encode(), digestmod="sha256")  # Copied for every signature.
+        self._auth_headers = {"X-MBX-APIKEY": access_key}
 
     async def ping(self):
         """Test connectivity to the Rest API."""
@@ -213,6 +287,24 @@ class BinanceFutureRestAPI:
         success, error = await self.request("DELETE", uri, params=params, auth=True)
         return success, error
 
+    async def revoke_all_orders(self, symbol):
+        """ Cancel all open orders of a symbol.
+
+        Args:
+            symbol: Symbol name, e.g. BTCUSDT.
+
+        Returns:
+            success: Success results, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        uri = "/fapi/v1/allOpenOrders"
+        params = {
+            "symbol": symbol,
+            "timestamp": tools.get_cur_timestamp_ms()
+        }
+        success, error = await self.request("DELETE", uri, params=params, auth=True)
+        return success, error
+
     async def get_order_status(self, symbol, order_id, client_order_id):
         """ Check an order's status.
 
@@ -351,22 +443,125 @@ class BinanceFutureRestAPI:
             data.update(params)
         if body:
             data.update(body)
-        if not headers:
-            headers = {}
-        if data:
-            query = "&".join(["=".join([str(k), str(v)]) for k, v in data.items()])
-        else:
-            query = ""
+        query = urlencode(data) if data else ""
         if auth and query:
-            signature = hmac.new(self._secret_key.encode(), query.encode(), hashlib.sha256).hexdigest()
-            query += "&signature={s}".format(s=signature)
-            headers["X-MBX-APIKEY"] = self._access_key
+            h = self._hmac.copy()
+            h.update(query.encode("ascii"))  # urlencode output is pure ASCII.
+            query += "&signature=" + h.hexdigest()
+            if headers:
+                headers.update(self._auth_headers)
+            else:
+                headers = self._auth_headers
         if query:
             url += ("?" + query)
         _, success, error = await AsyncHttpRequests.fetch(method, url, headers=headers, timeout=10)
         return success, error
 
 
+class BinanceFutureUserStream:
+    """ User data stream of an account, one listen key and one Websocket connection are shared by all the
+    `BinanceFutureTrade` objects of the same account, messages are dispatched to them by symbol.
+
+    Attributes:
+        rest_api: REST API client of this account.
+        wss: Websocket address.
+    """
+
+    # User data streams, e.g. {(wss, access_key): stream, ... }
+    _STREAMS = {}
+
+    @classmethod
+    def register(cls, trade):
+        """ Register a trade object into the user data stream of its account, create the stream if not exist.
+
+        Args:
+            trade: `BinanceFutureTrade` object.
+        """
+        key = (trade._wss, trade._access_key)
+        stream = cls._STREAMS.get(key)
+        if not stream:
+            stream = cls(key, trade.rest_api, trade._wss)
+            cls._STREAMS[key] = stream
+        stream._add_trade(trade)
+
+    def __init__(self, key, rest_api, wss):
+        """Initialize."""
+        self._key = key  # Key of this stream in `_STREAMS`.
+        self._rest_api = rest_api
+        self._wss = wss
+        self._listen_key = None  # Listen key for Websocket authentication.
+        self._ws = None  # Websocket connection object.
+        self._connected = False  # If Websocket connection connected?
+        self._trades = {}  # Trade objects. e.g. {raw_symbol: [trade, ... ], ... }
+
+        # Create a loop run task to reset listen key every 20 minutes.
+        self._reset_task_id = LoopRunTask.register(self._reset_listen_key, 60 * 20)
+
+        # Create a coroutine to initialize Websocket connection.
+        SingleTask.run(self._init_websocket)
+
+    def _add_trade(self, trade):
+        self._trades.setdefault(trade._raw_symbol, []).append(trade)
+        if self._connected:
+            SingleTask.run(trade.connected_callback)
+
+    async def _init_websocket(self):
+        """ Initialize Websocket connection.
+        """
+        # Get listen key first.
+        success, error = await self._rest_api.get_listen_key()
+        if error:
+            e = Error("get listen key failed: {}".format(error))
+            logger.error(e, caller=self)
+            # Remove this stream, so that the trade objects registered later will create a new stream and retry.
+            if self._STREAMS.get(self._key) is self:
+                del self._STREAMS[self._key]
+            LoopRunTask.unregister(self._reset_task_id)
+            for trades in self._trades.values():
+                for trade in trades:
+                    SingleTask.run(trade._init_success_callback, False, e)
+            return
+        self._listen_key = success["listenKey"]
+        uri = "/ws/" + self._listen_key
+        url = urljoin(self._wss, uri)
+        self._ws = Websocket(url, self.connected_callback, process_callback=self.process)
+        self._ws.initialize()
+
+    async def _reset_listen_key(self, *args, **kwargs):
+        """ Reset listen key.
+        """
+        if not self._listen_key:
+            logger.error("listen key not initialized!", caller=self)
+            return
+        await self._rest_api.put_listen_key(self._listen_key)
+        logger.info("reset listen key success!", caller=self)
+
+    async def connected_callback(self):
+        """ After websocket connection created successfully, notify all the trade objects.
+        """
+        self._connected = True
+        for trades in self._trades.values():
+            for trade in trades:
+                SingleTask.run(trade.connected_callback)
+
+    async def process(self, msg):
+        """ Process message that received from Websocket connection, and dispatch to trade objects.
+
+        Args:
+            msg: message received from Websocket connection.
+        """
+        if logger.debug_enabled():
+            logger.debug("msg:", _json_dumps(msg), caller=self)
+        e = msg.get("e")
+        if e == "ORDER_TRADE_UPDATE":  # Order update, only for the trade objects of this symbol.
+            for trade in self._trades.get(msg["o"]["s"], ()):
+                await trade.process(msg)
+        elif e == "ACCOUNT_UPDATE":  # Balance and position update, for all the trade objects.
+            for trades in self._trades.values():
+                for trade in trades:
+                    await trade.process(msg)
+
+
 class BinanceFutureTrade:
     """ Binance Future Trade module. You can initialize trade object with some attributes in kwargs.
 
@@ -426,12 +621,13 @@ class BinanceFutureTrade:
         self._init_success_callback = kwargs.get("init_success_callback")
 
         self._ok = False  # Initialize successfully ?
+        self._pos_interval = POSITION_CHECK_INTERVAL  # Interval(seconds) of polling position information.
 
-        self._raw_symbol = self._symbol  # Row symbol name, same as Binance Exchange.
+        self._raw_symbol = sys.intern(self._symbol)  # Row symbol name, same as Binance Exchange.
 
-        self._listen_key = None  # Listen key for Websocket authentication.
         self._assets = {}  # Asset data. e.g. {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }
         self._orders = {}  # Order data. e.g. {order_no: order, ... }
+        self._orders_by_id = {}  # Order data indexed by Binance order id, for websocket message lookup.
         self._position = Position(self._platform, self._account, self._strategy, self._symbol)  # 仓位
 
         # Initialize our REST API client.
@@ -441,17 +637,14 @@ class BinanceFutureTrade:
         if self._asset_update_callback:
             AssetSubscribe(self._platform, self._account, self.on_event_asset_update)
 
-        # Create a loop run task to reset listen key every 20 minutes.
-        LoopRunTask.register(self._reset_listen_key, 60 * 20)
-
-        # Create a loop run task to check position information per 1 second.
-        LoopRunTask.register(self._check_position_update, 1)
+        # Create a coroutine to check position information per `self._pos_interval` seconds.
+        SingleTask.run(self._pos_loop)
 
         # Create a loop run task to send ping message to server per 30 seconds.
         # LoopRunTask.register(self._send_heartbeat_msg, 10)
 
-        # Create a coroutine to initialize Websocket connection.
-        SingleTask.run(self._init_websocket)
+        # Register into the user data stream of this account, it's shared by all the symbols.
+        BinanceFutureUserStream.register(self)
 
     @property
     def assets(self):
@@ -465,31 +658,6 @@ class BinanceFutureTrade:
     def rest_api(self):
         return self._rest_api
 
-    async def _init_websocket(self):
-        """ Initialize Websocket connection.
-        """
-        # Get listen key first.
-        success, error = await self._rest_api.get_listen_key()
-        if error:
-            e = Error("get listen key failed: {}".format(error))
-            logger.error(e, caller=self)
-            SingleTask.run(self._init_success_callback, False, e)
-            return
-        self._listen_key = success["listenKey"]
-        uri = "/ws/" + self._listen_key
-        url = urljoin(self._wss, uri)
-        self._ws = Websocket(url, self.connected_callback, process_callback=self.process)
-        self._ws.initialize()
-
-    async def _reset_listen_key(self, *args, **kwargs):
-        """ Reset listen key.
-        """
-        if not self._listen_key:
-            logger.error("listen key not initialized!", caller=self)
-            return
-        await self._rest_api.put_listen_key(self._listen_key)
-        logger.info("reset listen key success!", caller=self)
-
     # async def _send_heartbeat_msg(self, *args, **kwargs):
     #     """Send ping to server."""
     #     hb = {"ping": tools.get_cur_timestamp_ms()}
@@ -506,19 +674,8 @@ class BinanceFutureTrade:
             return
         for order_info in order_infos:
             order_no = "{}_{}".format(order_info["orderId"], order_info["clientOrderId"])
-            if order_info["status"] == "NEW":
-                status = ORDER_STATUS_SUBMITTED
-            elif order_info["status"] == "PARTIAL_FILLED":
-                status = ORDER_STATUS_PARTIAL_FILLED
-            elif order_info["status"] == "FILLED":
-                status = ORDER_STATUS_FILLED
-            elif order_info["status"] == "CANCELED":
-                status = ORDER_STATUS_CANCELED
-            elif order_info["status"] == "REJECTED":
-                status = ORDER_STATUS_FAILED
-            elif order_info["status"] == "EXPIRED":
-                status = ORDER_STATUS_FAILED
-            else:
+            status = _STATUS_MAP.get(order_info["status"])
+            if status is None:
                 logger.warn("unknown status:", order_info, caller=self)
                 continue
 
@@ -527,23 +684,25 @@ class BinanceFutureTrade:
                 "account": self._account,
                 "strategy": self._strategy,
                 "order_no": order_no,
-                "action": order_info["side"],
-                "order_type": order_info["type"],
+                "action": _ACTION_MAP.get(order_info["side"], order_info["side"]),
+                "order_type": _ORDER_TYPE_MAP.get(order_info["type"], order_info["type"]),
                 "symbol": self._symbol,
                 "price": order_info["price"],
                 "quantity": order_info["origQty"],
-                "remain": float(order_info["origQty"]) - float(order_info["executedQty"]),
+                "remain": _remain_quantity(order_info["origQty"], order_info["executedQty"], status),
                 "status": status,
-                "trade_type": int(order_info["clientOrderId"][-1]),
+                "trade_type": _trade_type(order_info["clientOrderId"]),
                 "ctime": order_info["updateTime"],
                 "utime": order_info["updateTime"]
             }
             order = Order(**info)
             self._orders[order_no] = order
+            self._orders_by_id[order_info["orderId"]] = order
             SingleTask.run(self._order_update_callback, copy.copy(order))
 
         self._ok = True
         SingleTask.run(self._init_success_callback, True, None)
+        SingleTask.run(self._check_position_update)  # Pull back position information right now.
 
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT):
         """ Create an order.
@@ -571,7 +730,7 @@ class BinanceFutureTrade:
         quantity = abs(float(quantity))
         price = tools.float_to_str(price)
         quantity = tools.float_to_str(quantity)
-        client_order_id = tools.get_uuid1().replace("-", "")[:21] + str(trade_type)
+        client_order_id = "%021x%d" % (random.getrandbits(84), trade_type)  # 21 random hex digits + trade type.
         result, error = await self._rest_api.create_order(action, self._raw_symbol, price, quantity, client_order_id)
         if error:
             return None, error
@@ -591,14 +750,17 @@ class BinanceFutureTrade:
         """
         # If len(order_nos) == 0, you will cancel all orders for this symbol(initialized in Trade object).
         if len(order_nos) == 0:
+            _, error = await self._rest_api.revoke_all_orders(self._raw_symbol)
+            if not error:
+                return True, None
+            logger.warn("revoke all orders error:", error, "revoke orders one by one.", caller=self)
             order_infos, error = await self._rest_api.get_open_orders(self._raw_symbol)
             if error:
                 return False, error
-            for order_info in order_infos:
-                _, error = await self._rest_api.revoke_order(self._raw_symbol, order_info["orderId"],
-                                                             order_info["clientOrderId"])
-                if error:
-                    return False, error
+            ids = [(order_info["orderId"], order_info["clientOrderId"]) for order_info in order_infos]
+            for e in await self._revoke_orders(ids):
+                if e:
+                    return False, e
             return True, None
 
         # If len(order_nos) == 1, you will cancel an order.
@@ -613,15 +775,34 @@ class BinanceFutureTrade:
         # If len(order_nos) > 1, you will cancel multiple orders.
         if len(order_nos) > 1:
             success, error = [], []
-            for order_no in order_nos:
-                order_id, client_order_id = order_no.split("_")
-                _, e = await self._rest_api.revoke_order(self._raw_symbol, order_id, client_order_id)
+            errors = await self._revoke_orders([order_no.split("_") for order_no in order_nos])
+            for order_no, e in zip(order_nos, errors):
                 if e:
                     error.append((order_no, e))
                 else:
                     success.append(order_no)
             return success, error
 
+    async def _revoke_orders(self, ids):
+        """ Revoke multiple orders concurrently, at most `REVOKE_ORDER_CONCURRENCY` requests in flight.
+
+        Args:
+            ids: Order id list, e.g. [(order_id, client_order_id), ... ]
+
+        Returns:
+            errors: Error information list for each order, None if revoked successfully.
+        """
+        semaphore = asyncio.Semaphore(REVOKE_ORDER_CONCURRENCY)
+
+        async def revoke(order_id, client_order_id):
+            async with semaphore:
+                _, error = await self._rest_api.revoke_order(self._raw_symbol, order_id, client_order_id)
+                return error
+
+        results = await asyncio.gather(*(revoke(order_id, client_order_id) for order_id, client_order_id in ids),
+                                       return_exceptions=True)
+        return results
+
     async def get_open_order_nos(self):
         """ Get open order no list.
         """
@@ -634,23 +815,44 @@ class BinanceFutureTrade:
             order_nos.append(order_no)
         return order_nos, None
 
-    @async_method_locker("BinanceTrade.process.locker")
     async def process(self, msg):
         """ Process message that received from Websocket connection.
 
         Args:
             msg: message received from Websocket connection.
+
+        * NOTE: There is no `await` in this method, each message is processed atomically on the event loop, so it
+            needs no locker.
         """
-        logger.debug("msg:", json.dumps(msg), caller=self)
         e = msg.get("e")
         if e == "ORDER_TRADE_UPDATE":  # Order update.
             self._update_order(msg["o"])
+        elif e == "ACCOUNT_UPDATE":  # Balance and position update.
+            self._update_position_from_account(msg["a"])
+
+    async def _pos_loop(self):
+        """ Check position update per `self._pos_interval` seconds. The next deadline is computed from `loop.time()`,
+        so that the time spent on each check won't accumulate into drift, and nothing is polled before initialized.
+        """
+        loop = asyncio.get_event_loop()
+        deadline = loop.time()
+        while True:
+            deadline += self._pos_interval
+            now = loop.time()
+            if deadline < now:  # Event loop was blocked too long, re-sync instead of checking repeatedly.
+                deadline = now + self._pos_interval
+            await asyncio.sleep(deadline - now)
+            if not self._ok:
+                continue
+            try:
+                await self._check_position_update()
+            except Exception as e:
+                logger.error("check position update error:", e, caller=self)
 
     async def _check_position_update(self, *args, **kwargs):
         """Check position update."""
         if not self._ok:
             return
-        update = False
         success, error = await self._rest_api.get_position()
         if error:
             return
@@ -661,11 +863,38 @@ class BinanceFutureTrade:
                 position_info = item
                 break
 
+        if self._update_position(float(position_info["positionAmt"]), float(position_info["entryPrice"])):
+            await self._position_update_callback(copy.copy(self._position))
+
+    def _update_position_from_account(self, account_info):
+        """ Position update, pushed by `ACCOUNT_UPDATE` message.
+
+        Args:
+            account_info: Account information, e.g. {"B": [...], "P": [{"s": "BTCUSDT", "pa": "1", "ep": "9000"}, ...]}
+        """
+        if not self._ok:
+            return
+        for position_info in account_info.get("P", ()):
+            if position_info["s"] != self._raw_symbol:
+                continue
+            if self._update_position(float(position_info["pa"]), float(position_info["ep"])):
+                SingleTask.run(self._position_update_callback, copy.copy(self._position))
+            break
+
+    def _update_position(self, size, average_price):
+        """ Update position object.
+
+        Args:
+            size: Position amount, > 0 is long position, < 0 is short position.
+            average_price: Entry price.
+
+        Returns:
+            update: True if position changed, otherwise False.
+        """
+        update = False
         if not self._position.utime:  # Callback position info when initialized.
             update = True
             self._position.update()
-        size = float(position_info["positionAmt"])
-        average_price = float(position_info["entryPrice"])
         if size > 0:
             if self._position.long_quantity != size:
                 update = True
@@ -678,8 +907,7 @@ class BinanceFutureTrade:
             if self._position.long_quantity != 0 or self._position.short_quantity != 0:
                 update = True
                 self._position.update()
-        if update:
-            await self._position_update_callback(copy.copy(self._position))
+        return update
 
     def _update_order(self, order_info):
         """ Order update.
@@ -690,47 +918,42 @@ class BinanceFutureTrade:
         Returns:
             Return order object if or None.
         """
-        if order_info["s"] != self._raw_symbol:
+        symbol = order_info["s"]
+        if symbol is not self._raw_symbol and symbol != self._raw_symbol:
             return
-        order_no = "{}_{}".format(order_info["i"], order_info["c"])
-
-        if order_info["X"] == "NEW":
-            status = ORDER_STATUS_SUBMITTED
-        elif order_info["X"] == "PARTIAL_FILLED":
-            status = ORDER_STATUS_PARTIAL_FILLED
-        elif order_info["X"] == "FILLED":
-            status = ORDER_STATUS_FILLED
-        elif order_info["X"] == "CANCELED":
-            status = ORDER_STATUS_CANCELED
-        elif order_info["X"] == "REJECTED":
-            status = ORDER_STATUS_FAILED
-        elif order_info["X"] == "EXPIRED":
-            status = ORDER_STATUS_FAILED
-        else:
+        status = _STATUS_MAP.get(order_info["X"])
+        if status is None:
             return
-        order = self._orders.get(order_no)
+        order = self._orders_by_id.get(order_info["i"])
         if not order:
+            order_no = "{}_{}".format(order_info["i"], order_info["c"])
             info = {
                 "platform": self._platform,
                 "account": self._account,
                 "strategy": self._strategy,
                 "order_no": order_no,
-                "action": order_info["S"],
-                "order_type": order_info["o"],
+                "action": _ACTION_MAP.get(order_info["S"], order_info["S"]),
+                "order_type": _ORDER_TYPE_MAP.get(order_info["o"], order_info["o"]),
                 "symbol": self._symbol,
                 "price": order_info["p"],
                 "quantity": order_info["q"],
+                "trade_type": _trade_type(order_info["c"]),
                 "ctime": order_info["T"]
             }
             order = Order(**info)
             self._orders[order_no] = order
-        order.remain = float(order_info["q"]) - float(order_info["z"])
+            self._orders_by_id[order_info["i"]] = order
+        order.remain = _remain_quantity(order_info["q"], order_info["z"], status)
         order.avg_price = order_info["L"]
         order.status = status
         order.utime = order_info["T"]
-        order.trade_type = int(order_no[-1])
         SingleTask.run(self._order_update_callback, copy.copy(order))
 
+        # Delete order that already completed.
+        if status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
+            self._orders.pop(order.order_no, None)
+            self._orders_by_id.pop(order_info["i"], None)
+
     async def on_event_asset_update(self, asset: Asset):
         """ Asset data update callback.
 
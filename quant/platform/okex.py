@@ -212,7 +212,7 @@ class OKExRestAPI:
             if not headers:
                 headers = {}
             headers["Content-Type"] = "application/json"
-            headers["OK-ACCESS-KEY"] = self._access_key.encode().decode()
+            headers["OK-ACCESS-KEY"] = self._access_key
             headers["OK-ACCESS-SIGN"] = sign.decode()
             headers["OK-ACCESS-TIMESTAMP"] = str(timestamp)
             headers["OK-ACCESS-PASSPHRASE"] = self._passphrase
@@ -13,11 +13,25 @@ Email:  huangtao@ifclover.com
 
 import time
 import zlib
-import json
+import asyncio
 import copy
 import hmac
 import base64
-from urllib.parse import urljoin
+from operator import itemgetter
+from types import MappingProxyType
+from urllib.parse import urljoin, urlencode
+
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    _json_loads = orjson.loads
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
+    _json_dumps = json.dumps
+    _json_loads = json.loads
 
 from quant.error import Error
 from quant.order import Order
@@ -29,7 +43,6 @@ from quant.const import OKEX_FUTURE
 from quant.utils.websocket import Websocket
 from quant.asset import Asset, AssetSubscribe
 from quant.utils.http_client import AsyncHttpRequests
-from quant.utils.decorator import async_method_locker
 from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
 from quant.order import ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET
 from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED, \
@@ -38,6 +51,39 @@ from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORD
 
 __all__ = ("OKExFutureRestAPI", "OKExFutureTrade", )
 
+# Params that must be set when initializing trade object.
+REQUIRED_PARAMS = ("account", "strategy", "symbol", "access_key", "secret_key", "passphrase")
+
+# Max orders count of a batch cancel request, limited by OKEx.
+REVOKE_BATCH_SIZE = 10
+
+# Max concurrent requests when revoking multiple orders.
+REVOKE_ORDER_CONCURRENCY = 10
+
+# OKEx Future order state to our order status.
+_STATE_MAP = {
+    "-2": ORDER_STATUS_FAILED,
+    "-1": ORDER_STATUS_CANCELED,
+    "0": ORDER_STATUS_SUBMITTED,
+    "1": ORDER_STATUS_PARTIAL_FILLED,
+    "2": ORDER_STATUS_FILLED
+}
+
+# OKEx Future order states that is finished, the order will be removed from cache.
+_TERMINAL_STATES = frozenset(("-2", "-1", "2"))
+
+# OKEx Future order types that is buy action, 1 - open long, 4 - close short.
+_BUY_TYPES = frozenset(("1", "4"))
+
+# Get `order_id` from order information.
+_get_order_id = itemgetter("order_id")
+
+
+def _timestamp():
+    """ Current timestamp string for signature, in seconds with 3 decimal places, e.g. "1563440000.123"."""
+    ns = time.time_ns()
+    return "%d.%03d" % (ns // 1000000000, ns // 1000000 % 1000)
+
 
 class OKExFutureRestAPI:
     """ OKEx Future REST API client.
@@ -55,6 +101,13 @@ class OKExFutureRestAPI:
         self._access_key = access_key
         self._secret_key = secret_key
         self._passphrase = passphrase
+        self._hmac = hmac.new(secret_key.encode(), digestmod="sha256")  # Copied for every signature.
+        self._auth_headers = {  # Static authentication headers.
+            "Content-Type": "application/json",
+            "OK-ACCESS-KEY": access_key,
+            "OK-ACCESS-PASSPHRASE": passphrase
+        }
+        self._inflight = {}  # In-flight GET requests, e.g. {uri: Task, ... }
 
     async def get_user_account(self):
         """ Get account asset information.
@@ -75,7 +128,7 @@ class OKExFutureRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/futures/v3/{instrument_id}/position".format(instrument_id=instrument_id)
+        uri = f"/api/futures/v3/{instrument_id}/position"
         success, error = await self.request("GET", uri, auth=True)
         return success, error
 
@@ -116,8 +169,7 @@ class OKExFutureRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/futures/v3/cancel_order/{instrument_id}/{order_id}".format(
-            instrument_id=instrument_id, order_id=order_no)
+        uri = f"/api/futures/v3/cancel_order/{instrument_id}/{order_no}"
         success, error = await self.request("POST", uri, auth=True)
         if error:
             return None, error
@@ -140,7 +192,7 @@ class OKExFutureRestAPI:
         assert isinstance(order_ids, list)
         if len(order_ids) > 10:
             logger.warn("order id list too long! no more than 10!", caller=self)
-        uri = "/api/futures/v3/cancel_batch_orders/{instrument_id}".format(instrument_id=instrument_id)
+        uri = f"/api/futures/v3/cancel_batch_orders/{instrument_id}"
         body = {
             "order_ids": order_ids
         }
@@ -162,8 +214,7 @@ class OKExFutureRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/futures/v3/orders/{instrument_id}/{order_id}".format(
-            instrument_id=instrument_id, order_id=order_id)
+        uri = f"/api/futures/v3/orders/{instrument_id}/{order_id}"
         success, error = await self.request("GET", uri, auth=True)
         return success, error
 
@@ -183,7 +234,7 @@ class OKExFutureRestAPI:
 
         TODO: Add args `from` & `to`.
         """
-        uri = "/api/futures/v3/orders/{instrument_id}".format(instrument_id=instrument_id)
+        uri = f"/api/futures/v3/orders/{instrument_id}"
         params = {
             "state": state,
             "limit": limit
@@ -192,7 +243,7 @@ class OKExFutureRestAPI:
         return success, error
 
     async def get_kline(self, instrument_id, start, end, granularity=60*60):
-        uri = "/api/futures/v3/instruments/{instrument_id}/candles".format(instrument_id=instrument_id)
+        uri = f"/api/futures/v3/instruments/{instrument_id}/candles"
         params = {'granularity': granularity, 'start': start, 'end': end}
         success, error = await self.request("GET", uri, params=params, auth=False)
         return success, error
@@ -213,33 +264,51 @@ class OKExFutureRestAPI:
             error: Error information, otherwise it's None.
         """
         if params:
-            query = "&".join(["{}={}".format(k, params[k]) for k in sorted(params.keys())])
-            uri += "?" + query
+            uri += "?" + urlencode(sorted(params.items()))
+
+        # Identical GET requests that are in flight share one HTTP round trip, e.g. bootstrap after reconnect.
+        if method == "GET":
+            task = self._inflight.get(uri)
+            if not task:
+                task = asyncio.ensure_future(self._fetch(method, uri, body, headers, auth))
+                self._inflight[uri] = task
+                task.add_done_callback(lambda _: self._inflight.pop(uri, None))
+            return await asyncio.shield(task)
+        return await self._fetch(method, uri, body, headers, auth)
+
+    async def _fetch(self, method, uri, body, headers, auth):
+        """ Sign and send HTTP request, see `request`."""
         url = urljoin(self._host, uri)
 
         if auth:
-            timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
-            if body:
-                body = json.dumps(body)
-            else:
-                body = ""
-            message = str(timestamp) + str.upper(method) + uri + str(body)
-            mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf-8"),
-                           digestmod="sha256")
-            d = mac.digest()
-            sign = base64.b64encode(d)
-
+            body = _json_dumps(body) if body else ""
             if not headers:
                 headers = {}
-            headers["Content-Type"] = "application/json"
-            headers["OK-ACCESS-KEY"] = self._access_key.encode().decode()
-            headers["OK-ACCESS-SIGN"] = sign.decode()
-            headers["OK-ACCESS-TIMESTAMP"] = str(timestamp)
-            headers["OK-ACCESS-PASSPHRASE"] = self._passphrase
+            headers.update(self._sign(method, uri, body))
 
         _, success, error = await AsyncHttpRequests.fetch(method, url, body=body, headers=headers, timeout=10)
         return success, error
 
+    def _sign(self, method, uri, body):
+        """ Generate authentication headers for a request.
+
+        Args:
+            method: HTTP request method.
+            uri: HTTP request uri, including query string.
+            body: HTTP request body string.
+
+        Returns:
+            headers: Authentication headers.
+        """
+        timestamp = _timestamp()
+        message = timestamp + method.upper() + uri + body
+        mac = self._hmac.copy()
+        mac.update(message.encode())
+        headers = dict(self._auth_headers)
+        headers["OK-ACCESS-SIGN"] = base64.b64encode(mac.digest()).decode()
+        headers["OK-ACCESS-TIMESTAMP"] = timestamp
+        return headers
+
 
 class OKExFutureTrade(Websocket):
     """ OKEx Future Trade module. You can initialize trade object with some attributes in kwargs.
@@ -270,22 +339,13 @@ class OKExFutureTrade(Websocket):
     def __init__(self, **kwargs):
         """Initialize."""
         e = None
-        if not kwargs.get("account"):
-            e = Error("param account miss")
-        if not kwargs.get("strategy"):
-            e = Error("param strategy miss")
-        if not kwargs.get("symbol"):
-            e = Error("param symbol miss")
+        missing = [key for key in REQUIRED_PARAMS if not kwargs.get(key)]
+        if missing:
+            e = Error("param {} miss".format(", ".join(missing)))
         if not kwargs.get("host"):
             kwargs["host"] = "https://www.okex.com"
         if not kwargs.get("wss"):
             kwargs["wss"] = "wss://real.okex.com:8443"
-        if not kwargs.get("access_key"):
-            e = Error("param access_key miss")
-        if not kwargs.get("secret_key"):
-            e = Error("param secret_key miss")
-        if not kwargs.get("passphrase"):
-            e = Error("param passphrase miss")
         if e:
             logger.error(e, caller=self)
             if kwargs.get("init_success_callback"):
@@ -312,11 +372,13 @@ class OKExFutureTrade(Websocket):
 
         self._assets = {}  # Asset object. e.g. {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }
         self._orders = {}  # Order objects. e.g. {"order_no": Order, ... }
+        self._orders_view = MappingProxyType(self._orders)  # Read-only view of order objects.
         self._position = Position(self._platform, self._account, self._strategy, self._symbol)
 
         # Subscribing our channels.
         self._order_channel = "futures/order:{symbol}".format(symbol=self._symbol)
         self._position_channel = "futures/position:{symbol}".format(symbol=self._symbol)
+        self._subscribe_msg = _json_dumps({"op": "subscribe", "args": [self._order_channel, self._position_channel]})
 
         # If our channels that subscribed successfully.
         self._subscribe_order_ok = False
@@ -333,11 +395,13 @@ class OKExFutureTrade(Websocket):
 
     @property
     def assets(self):
-        return copy.copy(self._assets)
+        """Asset snapshot, it's replaced on every update, DO NOT modify it."""
+        return self._assets
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        """Read-only view of order objects, copy it if you want a snapshot."""
+        return self._orders_view
 
     @property
     def position(self):
@@ -349,18 +413,16 @@ class OKExFutureTrade(Websocket):
 
     async def connected_callback(self):
         """After websocket connection created successfully, we will send a message to server for authentication."""
-        timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
-        message = str(timestamp) + "GET" + "/users/self/verify"
-        mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf8"), digestmod="sha256")
-        d = mac.digest()
+        timestamp = _timestamp()
+        message = timestamp + "GET/users/self/verify"
+        d = hmac.digest(self._secret_key.encode(), message.encode(), "sha256")
         signature = base64.b64encode(d).decode()
         data = {
             "op": "login",
             "args": [self._access_key, self._passphrase, timestamp, signature]
         }
-        await self.ws.send_json(data)
+        await self.ws.send_str(_json_dumps(data))
 
-    @async_method_locker("OKExFutureTrade.process_binary.locker")
     async def process_binary(self, raw):
         """ Process binary message that received from websocket.
 
@@ -370,72 +432,78 @@ class OKExFutureTrade(Websocket):
         Returns:
             None.
         """
-        decompress = zlib.decompressobj(-zlib.MAX_WBITS)
-        msg = decompress.decompress(raw)
-        msg += decompress.flush()
-        msg = msg.decode()
-        if msg == "pong":
+        msg = zlib.decompress(raw, -zlib.MAX_WBITS)  # Raw deflate stream, inflated in one C call.
+        if msg == b"pong":
+            return
+        if logger.debug_enabled():
+            logger.debug("msg:", msg.decode(), caller=self)
+        msg = _json_loads(msg)  # Parse bytes directly, no need to decode to str first.
+
+        # Data push messages are the most frequent, dispatch them first.
+        table = msg.get("table")
+
+        # Order update message received.
+        if table == "futures/order":
+            for data in msg["data"]:
+                self._update_order(data)
+            return
+
+        # Position update message receive.
+        if table == "futures/position":
+            for data in msg["data"]:
+                self._update_position(data)
             return
-        logger.debug("msg:", msg, caller=self)
-        msg = json.loads(msg)
+
+        event = msg.get("event")
 
         # Authorization message received.
-        if msg.get("event") == "login":
+        if event == "login":
             if not msg.get("success"):
                 e = Error("Websocket connection authorized failed: {}".format(msg))
                 logger.error(e, caller=self)
                 SingleTask.run(self._init_success_callback, False, e)
                 return
             logger.info("Websocket connection authorized successfully.", caller=self)
-
-            # Fetch orders from server. (open + partially filled)
-            result, error = await self._rest_api.get_order_list(self._symbol, 6)
-            if error:
-                e = Error("get open orders error: {}".format(error))
-                SingleTask.run(self._init_success_callback, False, e)
-                return
-            if len(result) > 100:
-                logger.warn("order length too long! (more than 100)", caller=self)
-            for order_info in result["order_info"]:
-                self._update_order(order_info)
-
-            # Fetch positions from server.
-            position, error = await self._rest_api.get_position(self._symbol)
-            if error:
-                e = Error("get position error: {}".format(error))
-                SingleTask.run(self._init_success_callback, False, e)
-                return
-            if len(position["holding"]) > 0:
-                self._update_position(position["holding"][0])
-
-            # Subscribe order channel and position channel.
-            data = {
-                "op": "subscribe",
-                "args": [self._order_channel, self._position_channel]
-            }
-            await self.ws.send_json(data)
+            SingleTask.run(self._bootstrap_after_login)
             return
 
         # Subscribe response message received.
-        if msg.get("event") == "subscribe":
-            if msg.get("channel") == self._order_channel:
+        if event == "subscribe":
+            channel = msg.get("channel")
+            if channel == self._order_channel:
                 self._subscribe_order_ok = True
-            if msg.get("channel") == self._position_channel:
+            if channel == self._position_channel:
                 self._subscribe_position_ok = True
             if self._subscribe_order_ok and self._subscribe_position_ok:
                 SingleTask.run(self._init_success_callback, True, None)
+
+    async def _bootstrap_after_login(self):
+        """ Fetch open orders and position from server, then subscribe order channel and position channel.
+
+        * NOTE: It's running in a separate task, so that the websocket messages won't be blocked by REST requests.
+        """
+        # Fetch orders from server. (open + partially filled)
+        result, error = await self._rest_api.get_order_list(self._symbol, 6)
+        if error:
+            e = Error("get open orders error: {}".format(error))
+            SingleTask.run(self._init_success_callback, False, e)
             return
+        if len(result) > 100:
+            logger.warn("order length too long! (more than 100)", caller=self)
+        for order_info in result["order_info"]:
+            self._update_order(order_info)
 
-        # Order update message received.
-        if msg.get("table") == "futures/order":
-            for data in msg["data"]:
-                self._update_order(data)
+        # Fetch positions from server.
+        position, error = await self._rest_api.get_position(self._symbol)
+        if error:
+            e = Error("get position error: {}".format(error))
+            SingleTask.run(self._init_success_callback, False, e)
             return
+        if len(position["holding"]) > 0:
+            self._update_position(position["holding"][0])
 
-        # Position update message receive.
-        if msg.get("table") == "futures/position":
-            for data in msg["data"]:
-                self._update_position(data)
+        # Subscribe order channel and position channel.
+        await self.ws.send_str(self._subscribe_msg)
 
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT, *args, **kwargs):
         """ Create an order.
@@ -487,11 +555,18 @@ class OKExFutureTrade(Websocket):
                 return False, error
             if len(result) > 100:
                 logger.warn("order length too long! (more than 100)", caller=self)
-            for order_info in result["order_info"]:
-                order_no = order_info["order_id"]
-                _, error = await self._rest_api.revoke_order(self._symbol, order_no)
-                if error:
-                    return False, error
+            order_nos = list(map(_get_order_id, result["order_info"]))
+            batches = [order_nos[i:i + REVOKE_BATCH_SIZE] for i in range(0, len(order_nos), REVOKE_BATCH_SIZE)]
+            results = await asyncio.gather(*(self._rest_api.revoke_orders(self._symbol, batch) for batch in batches),
+                                           return_exceptions=True)
+            for batch, r in zip(batches, results):
+                result, e = (None, r) if isinstance(r, Exception) else r
+                if e:
+                    return False, e
+                # Result holds the accepted order ids, e.g. {"result": true, "order_ids": ["...", ... ], ...}
+                revoked = set(map(str, result.get("order_ids") or []))
+                if any(str(order_no) not in revoked for order_no in batch):
+                    return False, result
             return True, None
 
         # If len(order_nos) == 1, you will cancel an order.
@@ -505,8 +580,15 @@ class OKExFutureTrade(Websocket):
         # If len(order_nos) > 1, you will cancel multiple orders.
         if len(order_nos) > 1:
             success, error = [], []
-            for order_no in order_nos:
-                _, e = await self._rest_api.revoke_order(self._symbol, order_no)
+            semaphore = asyncio.Semaphore(REVOKE_ORDER_CONCURRENCY)
+
+            async def revoke(order_no):
+                async with semaphore:
+                    _, e = await self._rest_api.revoke_order(self._symbol, order_no)
+                    return e
+
+            results = await asyncio.gather(*(revoke(order_no) for order_no in order_nos), return_exceptions=True)
+            for order_no, e in zip(order_nos, results):
                 if e:
                     error.append((order_no, e))
                 else:
@@ -529,9 +611,7 @@ class OKExFutureTrade(Websocket):
         else:
             if len(success) > 100:
                 logger.warn("order length too long! (more than 100)", caller=self)
-            order_nos = []
-            for order_info in success["order_info"]:
-                order_nos.append(order_info["order_id"])
+            order_nos = list(map(_get_order_id, success["order_info"]))
             return order_nos, None
 
     def _update_order(self, order_info):
@@ -543,22 +623,12 @@ class OKExFutureTrade(Websocket):
         Returns:
             None.
         """
+        status = _STATE_MAP.get(order_info["state"])
+        if status is None:
+            return None
         order_no = str(order_info["order_id"])
-        state = order_info["state"]
         remain = int(order_info["size"]) - int(order_info["filled_qty"])
         ctime = tools.utctime_str_to_mts(order_info["timestamp"])
-        if state == "-2":
-            status = ORDER_STATUS_FAILED
-        elif state == "-1":
-            status = ORDER_STATUS_CANCELED
-        elif state == "0":
-            status = ORDER_STATUS_SUBMITTED
-        elif state == "1":
-            status = ORDER_STATUS_PARTIAL_FILLED
-        elif state == "2":
-            status = ORDER_STATUS_FILLED
-        else:
-            return None
 
         order = self._orders.get(order_no)
         if not order:
@@ -567,7 +637,7 @@ class OKExFutureTrade(Websocket):
                 "account": self._account,
                 "strategy": self._strategy,
                 "order_no": order_no,
-                "action": ORDER_ACTION_BUY if order_info["type"] in ["1", "4"] else ORDER_ACTION_SELL,
+                "action": ORDER_ACTION_BUY if order_info["type"] in _BUY_TYPES else ORDER_ACTION_SELL,
                 "symbol": self._symbol,
                 "price": order_info["price"],
                 "quantity": order_info["size"],
@@ -579,13 +649,13 @@ class OKExFutureTrade(Websocket):
         order.avg_price = order_info["price_avg"]
         order.ctime = ctime
         order.utime = ctime
-        self._orders[order_no] = order
+        if order_info["state"] in _TERMINAL_STATES:
+            self._orders.pop(order_no, None)
+        else:
+            self._orders[order_no] = order
 
         SingleTask.run(self._order_update_callback, copy.copy(order))
 
-        if status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
-            self._orders.pop(order_no)
-
     def _update_position(self, position_info):
         """ Position update.
 
@@ -601,7 +671,7 @@ class OKExFutureTrade(Websocket):
         self._position.short_avg_price = position_info["short_avg_cost"]
         self._position.liquid_price = position_info["liquidation_price"]
         self._position.utime = tools.utctime_str_to_mts(position_info["updated_at"])
-        SingleTask.run(self._position_update_callback, copy.copy(self.position))
+        SingleTask.run(self._position_update_callback, copy.copy(self._position))
 
     async def on_event_asset_update(self, asset: Asset):
         """ Asset event data callback.
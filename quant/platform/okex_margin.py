@@ -10,12 +10,25 @@ Email:  huangtao@ifclover.com
 """
 
 import time
-import json
 import hmac
+import asyncio
 import copy
 import zlib
 import base64
-from urllib.parse import urljoin
+from types import MappingProxyType
+from urllib.parse import urljoin, urlencode
+
+try:
+    import orjson
+
+    def _json_dumps(obj):
+        return orjson.dumps(obj).decode()
+
+    _json_loads = orjson.loads
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    import json
+    _json_dumps = json.dumps
+    _json_loads = json.loads
 
 from quant.error import Error
 from quant.utils import tools
@@ -35,6 +48,36 @@ from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORD
 
 __all__ = ("OKExMarginRestAPI", "OKExMarginTrade", )
 
+# Max orders count of a batch cancel request, limited by OKEx.
+REVOKE_BATCH_SIZE = 10
+
+# Max concurrent requests when revoking all orders.
+REVOKE_ORDER_CONCURRENCY = 10
+
+# OKEx Margin order state to our order status.
+_STATE_MAP = {
+    "-2": ORDER_STATUS_FAILED,
+    "-1": ORDER_STATUS_CANCELED,
+    "0": ORDER_STATUS_SUBMITTED,
+    "1": ORDER_STATUS_PARTIAL_FILLED,
+    "2": ORDER_STATUS_FILLED
+}
+
+# Order status that is finished, the order will be removed from cache.
+_TERMINAL_STATUSES = frozenset((ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED))
+
+# OKEx Margin order side to our order action.
+_ACTION_MAP = {
+    "buy": ORDER_ACTION_BUY,
+    "sell": ORDER_ACTION_SELL
+}
+
+
+def _timestamp():
+    """ Current timestamp string for signature, in seconds with 3 decimal places, e.g. "1563440000.123"."""
+    ns = time.time_ns()
+    return "%d.%03d" % (ns // 1000000000, ns // 1000000 % 1000)
+
 
 class OKExMarginRestAPI:
     """ OKEx Margin REST API client.
@@ -52,6 +95,12 @@ class OKExMarginRestAPI:
         self._access_key = access_key
         self._secret_key = secret_key
         self._passphrase = passphrase
+        self._hmac = hmac.new(secret_key.encode(), digestmod="sha256")  # Copied for every signature.
+        self._auth_headers = {  # Static authentication headers.
+            "Content-Type": "application/json",
+            "OK-ACCESS-KEY": access_key,
+            "OK-ACCESS-PASSPHRASE": passphrase
+        }
 
     async def get_margin_accounts(self):
         """ Get account asset information.
@@ -74,7 +123,7 @@ class OKExMarginRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/margin/v3/accounts/{instrument_id}".format(instrument_id=instrument_id)
+        uri = f"/api/margin/v3/accounts/{instrument_id}"
         success, error = await self.request("GET", uri, auth=True)
         return success, error
 
@@ -180,7 +229,7 @@ class OKExMarginRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/margin/v3/cancel_orders/{order_id}".format(order_id=order_id)
+        uri = f"/api/margin/v3/cancel_orders/{order_id}"
         body = {
             "instrument_id": instrument_id,
             "order_id": order_id
@@ -202,10 +251,12 @@ class OKExMarginRestAPI:
         """
         uri = "/api/margin/v3/cancel_batch_orders"
         assert isinstance(order_ids, list)
-        body = {
-            "instrument_id": instrument_id,
-            "order_ids": order_ids
-        }
+        body = [
+            {
+                "instrument_id": instrument_id,
+                "order_ids": order_ids
+            }
+        ]
         success, error = await self.request("POST", uri, body=body, auth=True)
         return success, error
 
@@ -219,7 +270,7 @@ class OKExMarginRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/margin/v3/orders/{order_id}".format(order_id=order_id)
+        uri = f"/api/margin/v3/orders/{order_id}"
         params = {
             "instrument_id": instrument_id
         }
@@ -260,7 +311,7 @@ class OKExMarginRestAPI:
 
         TODO: Add args `from` & `to`.
         """
-        uri = "/api/futures/v3/orders/{instrument_id}".format(instrument_id=instrument_id)
+        uri = f"/api/futures/v3/orders/{instrument_id}"
         params = {
             "status": status,
             "limit": limit
@@ -284,32 +335,39 @@ class OKExMarginRestAPI:
             error: Error information, otherwise it's None.
         """
         if params:
-            query = "&".join(["{}={}".format(k, params[k]) for k in sorted(params.keys())])
-            uri += "?" + query
+            uri += "?" + urlencode(sorted(params.items()))
         url = urljoin(self._host, uri)
 
         if auth:
-            timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
+            timestamp = _timestamp()
             if body:
-                body = json.dumps(body)
+                body = _json_dumps(body)
             else:
                 body = ""
-            message = str(timestamp) + str.upper(method) + uri + str(body)
-            mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf-8"),
-                           digestmod="sha256")
-            d = mac.digest()
-            sign = base64.b64encode(d)
-
             if not headers:
                 headers = {}
-            headers["Content-Type"] = "application/json"
-            headers["OK-ACCESS-KEY"] = self._access_key.encode().decode()
-            headers["OK-ACCESS-SIGN"] = sign.decode()
-            headers["OK-ACCESS-TIMESTAMP"] = str(timestamp)
-            headers["OK-ACCESS-PASSPHRASE"] = self._passphrase
+            headers.update(self._auth_headers)
+            headers["OK-ACCESS-SIGN"] = self.sign(timestamp, method, uri, body)
+            headers["OK-ACCESS-TIMESTAMP"] = timestamp
         _, success, error = await AsyncHttpRequests.fetch(method, url, body=body, headers=headers, timeout=10)
         return success, error
 
+    def sign(self, timestamp, method, uri, body=""):
+        """ Generate signature, used by both REST API requests and websocket login.
+
+        Args:
+            timestamp: Timestamp string, e.g. "1563440000.123".
+            method: HTTP request method.
+            uri: HTTP request uri, including query string.
+            body: HTTP request body string.
+
+        Returns:
+            signature: Base64 encoded HMAC-SHA256 signature string.
+        """
+        mac = self._hmac.copy()
+        mac.update((timestamp + method.upper() + uri + body).encode())
+        return base64.b64encode(mac.digest()).decode()
+
 
 class OKExMarginTrade(Websocket):
     """ OKEx Margin Trade module. You can initialize trade object with some attributes in kwargs.
@@ -373,7 +431,8 @@ class OKExMarginTrade(Websocket):
         self._init_success_callback = kwargs.get("init_success_callback")
 
         self._raw_symbol = self._symbol.replace("/", "-")
-        self._order_channel = "spot/order:{symbol}".format(symbol=self._raw_symbol)
+        self._order_channel = f"spot/order:{self._raw_symbol}"
+        self._subscribe_msg = _json_dumps({"op": "subscribe", "args": [self._order_channel]})
 
         url = self._wss + "/ws/v3"
         super(OKExMarginTrade, self).__init__(url, send_hb_interval=5)
@@ -381,6 +440,7 @@ class OKExMarginTrade(Websocket):
 
         self._assets = {}  # Asset object. e.g. {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }
         self._orders = {}  # Order objects. e.g. {"order_no": Order, ... }
+        self._orders_view = MappingProxyType(self._orders)  # Read-only view of order objects.
 
         # Initializing our REST API client.
         self._rest_api = OKExMarginRestAPI(self._host, self._access_key, self._secret_key, self._passphrase)
@@ -393,11 +453,13 @@ class OKExMarginTrade(Websocket):
 
     @property
     def assets(self):
-        return copy.copy(self._assets)
+        """Asset snapshot, it's replaced on every update, DO NOT modify it."""
+        return self._assets
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        """Read-only view of order objects, copy it if you want a snapshot."""
+        return self._orders_view
 
     @property
     def rest_api(self):
@@ -405,16 +467,13 @@ class OKExMarginTrade(Websocket):
 
     async def connected_callback(self):
         """After websocket connection created successfully, we will send a message to server for authentication."""
-        timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
-        message = str(timestamp) + "GET" + "/users/self/verify"
-        mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf8"), digestmod="sha256")
-        d = mac.digest()
-        signature = base64.b64encode(d).decode()
+        timestamp = _timestamp()
+        signature = self._rest_api.sign(timestamp, "GET", "/users/self/verify")
         data = {
             "op": "login",
             "args": [self._access_key, self._passphrase, timestamp, signature]
         }
-        await self.ws.send_json(data)
+        await self.ws.send_str(_json_dumps(data))
 
     @async_method_locker("OKExMarginTrade.process_binary.locker")
     async def process_binary(self, raw):
@@ -426,14 +485,12 @@ class OKExMarginTrade(Websocket):
         Returns:
             None.
         """
-        decompress = zlib.decompressobj(-zlib.MAX_WBITS)
-        msg = decompress.decompress(raw)
-        msg += decompress.flush()
-        msg = msg.decode()
-        if msg == "pong":
+        msg = zlib.decompress(raw, -zlib.MAX_WBITS)  # Raw deflate stream, inflated in one C call.
+        if msg == b"pong":
             return
-        logger.debug("msg:", msg, caller=self)
-        msg = json.loads(msg)
+        if logger.debug_enabled():
+            logger.debug("msg:", msg.decode(), caller=self)
+        msg = _json_loads(msg)  # Parse bytes directly, no need to decode to str first.
 
         # Authorization message received.
         if msg.get("event") == "login":
@@ -443,26 +500,7 @@ class OKExMarginTrade(Websocket):
                 SingleTask.run(self._init_success_callback, False, e)
                 return
             logger.info("Websocket connection authorized successfully.", caller=self)
-
-            # Fetch orders from server. (open + partially filled)
-            order_infos, error = await self._rest_api.get_open_orders(self._raw_symbol)
-            if error:
-                e = Error("get open orders error: {}".format(msg))
-                SingleTask.run(self._init_success_callback, False, e)
-                return
-            if len(order_infos) > 100:
-                logger.warn("order length too long! (more than 100)", caller=self)
-            for order_info in order_infos:
-                order_info["ctime"] = order_info["created_at"]
-                order_info["utime"] = order_info["timestamp"]
-                self._update_order(order_info)
-
-            # Subscribe order channel.
-            data = {
-                "op": "subscribe",
-                "args": [self._order_channel]
-            }
-            await self.ws.send_json(data)
+            SingleTask.run(self._bootstrap_after_login)
             return
 
         # Subscribe response message received.
@@ -481,6 +519,37 @@ class OKExMarginTrade(Websocket):
                 data["utime"] = data["last_fill_time"]
                 self._update_order(data)
 
+    async def _bootstrap_after_login(self):
+        """ Fetch open orders from server, then subscribe order channel.
+
+        * NOTE: It's running in a separate task, so that the websocket messages won't be blocked by REST requests.
+        """
+        # Fetch orders from server. (open + partially filled)
+        order_infos, error = await self._rest_api.get_open_orders(self._raw_symbol)
+        if error:
+            e = Error("get open orders error: {}".format(error))
+            SingleTask.run(self._init_success_callback, False, e)
+            return
+        if len(order_infos) > 100:
+            logger.warn("order length too long! (more than 100)", caller=self)
+        orders = []
+        for order_info in order_infos:
+            order_info["ctime"] = order_info["created_at"]
+            order_info["utime"] = order_info["timestamp"]
+            order = self._update_order(order_info, notify=False)
+            if order:
+                orders.append(order)
+
+        # Subscribe order channel.
+        await self.ws.send_str(self._subscribe_msg)
+
+        # Notify all the open orders at once, instead of creating a task for every order.
+        results = await asyncio.gather(*(self._order_update_callback(order) for order in orders),
+                                       return_exceptions=True)
+        for order, r in zip(orders, results):
+            if isinstance(r, Exception):
+                logger.error("order update callback error:", r, "order:", order, caller=self)
+
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT):
         """ Create an order.
 
@@ -524,11 +593,18 @@ class OKExMarginTrade(Websocket):
                 return False, error
             if len(order_infos) > 100:
                 logger.warn("order length too long! (more than 100)", caller=self)
-            for order_info in order_infos:
-                order_no = order_info["order_id"]
-                _, error = await self._rest_api.revoke_order(self._raw_symbol, order_no)
-                if error:
-                    return False, error
+            semaphore = asyncio.Semaphore(REVOKE_ORDER_CONCURRENCY)
+
+            async def revoke(order_no):
+                async with semaphore:
+                    _, e = await self._rest_api.revoke_order(self._raw_symbol, order_no)
+                    return e
+
+            results = await asyncio.gather(*(revoke(order_info["order_id"]) for order_info in order_infos),
+                                           return_exceptions=True)
+            for e in results:
+                if e:
+                    return False, e
             return True, None
 
         # If len(order_nos) == 1, you will cancel an order.
@@ -542,12 +618,21 @@ class OKExMarginTrade(Websocket):
         # If len(order_nos) > 1, you will cancel multiple orders.
         if len(order_nos) > 1:
             success, error = [], []
-            for order_no in order_nos:
-                _, e = await self._rest_api.revoke_order(self._raw_symbol, order_no)
+            batches = [list(order_nos[i:i + REVOKE_BATCH_SIZE]) for i in range(0, len(order_nos), REVOKE_BATCH_SIZE)]
+            results = await asyncio.gather(*(self._rest_api.revoke_orders(self._raw_symbol, batch)
+                                             for batch in batches), return_exceptions=True)
+            for batch, r in zip(batches, results):
+                result, e = (None, r) if isinstance(r, Exception) else r
                 if e:
-                    error.append((order_no, e))
-                else:
-                    success.append(order_no)
+                    error.extend((order_no, e) for order_no in batch)
+                    continue
+                # Result is grouped by trading pair, e.g. {"btc-usdt": [{"order_id": "...", "result": true}, ... ]}
+                for infos in result.values():
+                    for info in infos:
+                        if info.get("result"):
+                            success.append(info["order_id"])
+                        else:
+                            error.append((info["order_id"], info))
             return success, error
 
     async def get_open_order_nos(self):
@@ -571,37 +656,30 @@ class OKExMarginTrade(Websocket):
                 order_nos.append(order_info["order_id"])
             return order_nos, None
 
-    def _update_order(self, order_info):
+    def _update_order(self, order_info, notify=True):
         """ Order update.
 
         Args:
             order_info: Order information.
+            notify: If True, run `order_update_callback` with the updated order.
 
         Returns:
-            None.
+            order: Updated order object that passed (or should be passed) to callback, None if order state is unknown.
         """
-        order_no = str(order_info["order_id"])
-        state = order_info["state"]
-        remain = float(order_info["size"]) - float(order_info["filled_size"])
-        ctime = tools.utctime_str_to_mts(order_info["ctime"])
-        utime = tools.utctime_str_to_mts(order_info["utime"])
-
-        if state == "-2":
-            status = ORDER_STATUS_FAILED
-        elif state == "-1":
-            status = ORDER_STATUS_CANCELED
-        elif state == "0":
-            status = ORDER_STATUS_SUBMITTED
-        elif state == "1":
-            status = ORDER_STATUS_PARTIAL_FILLED
-        elif state == "2":
-            status = ORDER_STATUS_FILLED
-        else:
+        status = _STATE_MAP.get(order_info["state"])
+        if status is None:
             logger.error("status error! order_info:", order_info, caller=self)
             return None
+        order_no = str(order_info["order_id"])
+        size = order_info["size"]
+        remain = float(size) - float(order_info["filled_size"])
+        ctime_str, utime_str = order_info["ctime"], order_info["utime"]
+        ctime = tools.utctime_str_to_mts(ctime_str)
+        utime = ctime if utime_str == ctime_str else tools.utctime_str_to_mts(utime_str)
 
         order = self._orders.get(order_no)
-        if order:
+        cached = order is not None
+        if cached:
             order.remain = remain
             order.status = status
             order.price = order_info["price"]
@@ -611,23 +689,30 @@ class OKExMarginTrade(Websocket):
                 "account": self._account,
                 "strategy": self._strategy,
                 "order_no": order_no,
-                "action": ORDER_ACTION_BUY if order_info["side"] == "buy" else ORDER_ACTION_SELL,
+                "action": _ACTION_MAP.get(order_info["side"], ORDER_ACTION_SELL),
                 "symbol": self._symbol,
                 "price": order_info["price"],
-                "quantity": order_info["size"],
+                "quantity": size,
                 "remain": remain,
                 "status": status,
                 "avg_price": order_info["price"]
             }
             order = Order(**info)
-            self._orders[order_no] = order
         order.ctime = ctime
         order.utime = utime
 
-        SingleTask.run(self._order_update_callback, copy.copy(order))
+        if status in _TERMINAL_STATUSES:
+            if cached:
+                del self._orders[order_no]
+            # Finished order will never be updated again, so it's safe to pass it to callback without copy.
+        else:
+            if not cached:
+                self._orders[order_no] = order
+            order = copy.copy(order)
 
-        if status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
-            self._orders.pop(order_no)
+        if notify:
+            SingleTask.run(self._order_update_callback, order)
+        return order
 
     async def on_event_asset_update(self, asset: Asset):
         """ Asset event data callback.
@@ -17,6 +17,7 @@ import json
 import copy
 import hmac
 import base64
+from types import MappingProxyType
 from urllib.parse import urljoin
 
 from quant.error import Error
@@ -227,7 +228,7 @@ class OKExSwapRestAPI:
             if not headers:
                 headers = {}
             headers["Content-Type"] = "application/json"
-            headers["OK-ACCESS-KEY"] = self._access_key.encode().decode()
+            headers["OK-ACCESS-KEY"] = self._access_key
             headers["OK-ACCESS-SIGN"] = sign.decode()
             headers["OK-ACCESS-TIMESTAMP"] = str(timestamp)
             headers["OK-ACCESS-PASSPHRASE"] = self._passphrase
@@ -311,6 +312,7 @@ class OKExSwapTrade(Websocket):
 
         self._assets = {}  # Asset object. e.g. {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }
         self._orders = {}  # Order objects. e.g. {"order_no": Order, ... }
+        self._orders_view = MappingProxyType(self._orders)  # Read-only view of order objects.
         self._position = Position(self._platform, self._account, self._strategy, self._symbol)
 
         # Subscribing our channels.
@@ -332,11 +334,13 @@ class OKExSwapTrade(Websocket):
 
     @property
     def assets(self):
-        return copy.copy(self._assets)
+        """Asset snapshot, it's replaced on every update, DO NOT modify it."""
+        return self._assets
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        """Read-only view of order objects, copy it if you want a snapshot."""
+        return self._orders_view
 
     @property
     def position(self):
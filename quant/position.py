@@ -14,6 +14,9 @@ class Position:
     """ 持仓对象
     """
 
+    __slots__ = ("platform", "account", "strategy", "symbol", "short_quantity", "short_avg_price", "long_quantity",
+                 "long_avg_price", "liquid_price", "utime")
+
     def __init__(self, platform=None, account=None, strategy=None, symbol=None):
         """ 初始化持仓对象
         @param platform 交易平台
@@ -52,5 +55,13 @@ class Position:
                     liquid_price=self.liquid_price, utime=self.utime)
         return info
 
+    def __copy__(self):
+        """ 浅拷贝，比通用的 `copy.copy` 处理 __slots__ 对象更快
+        """
+        position = Position.__new__(self.__class__)
+        for name in Position.__slots__:
+            setattr(position, name, getattr(self, name))
+        return position
+
     def __repr__(self):
         return str(self)
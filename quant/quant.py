@@ -8,9 +8,15 @@ Date:   2017/04/26
 Email:  huangtao@ifclover.com
 """
 
+import ssl
 import signal
 import asyncio
 
+try:
+    import uvloop
+except ImportError:  # Fallback to the default asyncio event loop if uvloop is not installed.
+    uvloop = None
+
 from quant.utils import logger
 from quant.config import config
 
@@ -32,6 +38,7 @@ class Quant:
         self._get_event_loop()
         self._load_settings(config_module)
         self._init_logger()
+        self._check_openssl()
         self._init_db_instance()
         self._init_event_center()
         self._do_heartbeat()
@@ -45,15 +52,18 @@ class Quant:
 
         logger.info("start io loop ...", caller=self)
         self.loop.run_forever()
+        self._close_http_sessions()
 
     def stop(self):
-        """Stop the event loop."""
+        """Stop the event loop, HTTP sessions will be closed after the loop stopped."""
         logger.info("stop io loop.", caller=self)
         self.loop.stop()
 
     def _get_event_loop(self):
         """ Get a main io loop. """
         if not self.loop:
+            if uvloop:
+                asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
             self.loop = asyncio.get_event_loop()
         return self.loop
 
@@ -78,6 +88,15 @@ class Quant:
         else:
             logger.initLogger(level, path, name, clear, backup_count)
 
+    def _check_openssl(self):
+        """ Log OpenSSL version that `hashlib`/`hmac` linked against, request signature performance depends on it.
+
+        * NOTE: OpenSSL >= 1.1.1 uses CPU SHA extensions (SHA-NI) for SHA-256 if available.
+        """
+        logger.info("OpenSSL version:", ssl.OPENSSL_VERSION, caller=self)
+        if ssl.OPENSSL_VERSION_INFO < (1, 1, 1):
+            logger.warn("OpenSSL version is lower than 1.1.1, SHA-256 HMAC signature may be slow.", caller=self)
+
     def _init_db_instance(self):
         """Initialize db."""
         if config.mongodb:
@@ -92,6 +111,11 @@ class Quant:
             self.loop.run_until_complete(self.event_center.connect())
             config.register_run_time_update()
 
+    def _close_http_sessions(self):
+        """Close the keep-alive HTTP sessions, so that no unclosed connector is left behind."""
+        from quant.utils.http_client import AsyncHttpRequests
+        self.loop.run_until_complete(AsyncHttpRequests.close())
+
     def _do_heartbeat(self):
         """Start server heartbeat."""
         from quant.heartbeat import heartbeat
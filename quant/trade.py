@@ -9,6 +9,7 @@ Email:  huangtao@ifclover.com
 """
 
 import copy
+import importlib
 
 from quant import const
 from quant.error import Error
@@ -19,6 +20,47 @@ from quant.order import Order
 from quant.position import Position
 from quant.event import EventOrder
 
+# Trade module for each platform, e.g. {platform: (module path, class name), ... }
+PLATFORM_TRADES = {
+    const.OKEX: ("quant.platform.okex", "OKExTrade"),
+    const.OKEX_MARGIN: ("quant.platform.okex_margin", "OKExMarginTrade"),
+    const.OKEX_FUTURE: ("quant.platform.okex_future", "OKExFutureTrade"),
+    const.OKEX_SWAP: ("quant.platform.okex_swap", "OKExSwapTrade"),
+    const.DERIBIT: ("quant.platform.deribit", "DeribitTrade"),
+    const.BITMEX: ("quant.platform.bitmex", "BitmexTrade"),
+    const.BINANCE: ("quant.platform.binance", "BinanceTrade"),
+    const.BINANCE_FUTURE: ("quant.platform.binance_future", "BinanceFutureTrade"),
+    const.HUOBI: ("quant.platform.huobi", "HuobiTrade"),
+    const.COINSUPER: ("quant.platform.coinsuper", "CoinsuperTrade"),
+    const.COINSUPER_PRE: ("quant.platform.coinsuper_pre", "CoinsuperPreTrade"),
+    const.KRAKEN: ("quant.platform.kraken", "KrakenTrade"),
+    const.GATE: ("quant.platform.gate", "GateTrade"),
+    const.KUCOIN: ("quant.platform.kucoin", "KucoinTrade"),
+    const.HUOBI_FUTURE: ("quant.platform.huobi_future", "HuobiFutureTrade"),
+    const.DIGIFINEX: ("quant.platform.digifinex", "DigifinexTrade")
+}
+
+_TRADE_CLASSES = {}  # Resolved trade classes, e.g. {platform: class, ... }
+
+
+def get_trade_class(platform):
+    """ Get trade class for platform, the platform module is imported on first use and the class is cached.
+
+    Args:
+        platform: Exchange platform name.
+
+    Returns:
+        Trade class, or None if platform is not supported.
+    """
+    T = _TRADE_CLASSES.get(platform)
+    if T is None:
+        entry = PLATFORM_TRADES.get(platform)
+        if not entry:
+            return None
+        module_path, class_name = entry
+        T = _TRADE_CLASSES[platform] = getattr(importlib.import_module(module_path), class_name)
+    return T
+
 
 class Trade:
     """ Trade Module.
@@ -70,39 +112,8 @@ class Trade:
         self._position_update_callback = position_update_callback
         self._init_success_callback = init_success_callback
 
-        if platform == const.OKEX:
-            from quant.platform.okex import OKExTrade as T
-        elif platform == const.OKEX_MARGIN:
-            from quant.platform.okex_margin import OKExMarginTrade as T
-        elif platform == const.OKEX_FUTURE:
-            from quant.platform.okex_future import OKExFutureTrade as T
-        elif platform == const.OKEX_SWAP:
-            from quant.platform.okex_swap import OKExSwapTrade as T
-        elif platform == const.DERIBIT:
-            from quant.platform.deribit import DeribitTrade as T
-        elif platform == const.BITMEX:
-            from quant.platform.bitmex import BitmexTrade as T
-        elif platform == const.BINANCE:
-            from quant.platform.binance import BinanceTrade as T
-        elif platform == const.BINANCE_FUTURE:
-            from quant.platform.binance_future import BinanceFutureTrade as T
-        elif platform == const.HUOBI:
-            from quant.platform.huobi import HuobiTrade as T
-        elif platform == const.COINSUPER:
-            from quant.platform.coinsuper import CoinsuperTrade as T
-        elif platform == const.COINSUPER_PRE:
-            from quant.platform.coinsuper_pre import CoinsuperPreTrade as T
-        elif platform == const.KRAKEN:
-            from quant.platform.kraken import KrakenTrade as T
-        elif platform == const.GATE:
-            from quant.platform.gate import GateTrade as T
-        elif platform == const.KUCOIN:
-            from quant.platform.kucoin import KucoinTrade as T
-        elif platform == const.HUOBI_FUTURE:
-            from quant.platform.huobi_future import HuobiFutureTrade as T
-        elif platform == const.DIGIFINEX:
-            from quant.platform.digifinex import DigifinexTrade as T
-        else:
+        T = get_trade_class(platform)
+        if not T:
             logger.error("platform error:", platform, caller=self)
             e = Error("platform error")
             SingleTask.run(self._init_success_callback, False, e)
@@ -12,10 +12,23 @@ import json
 import aiohttp
 from urllib.parse import urlparse
 
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    _json_loads = json.loads
+
 from quant.utils import logger
 from quant.config import config
 
 
+# Idle connections are kept alive for this long(seconds), default of aiohttp is 15s which is too short for trading
+# requests that are sent every few seconds or minutes.
+KEEPALIVE_TIMEOUT = 60
+
+# HTTP methods that may carry a request body.
+BODY_METHODS = frozenset(("POST", "PUT", "DELETE"))
+
+
 class AsyncHttpRequests(object):
     """ Asynchronous HTTP Request Client.
     """
@@ -54,15 +67,9 @@ class AsyncHttpRequests(object):
         try:
             if method == "GET":
                 response = await session.get(url, params=params, headers=headers, timeout=timeout, **kwargs)
-            elif method == "POST":
-                response = await session.post(url, params=params, data=body, json=data, headers=headers,
-                                              timeout=timeout, **kwargs)
-            elif method == "PUT":
-                response = await session.put(url, params=params, data=body, json=data, headers=headers,
-                                             timeout=timeout, **kwargs)
-            elif method == "DELETE":
-                response = await session.delete(url, params=params, data=body, json=data, headers=headers,
-                                                timeout=timeout, **kwargs)
+            elif method in BODY_METHODS:
+                response = await session.request(method, url, params=params, data=body, json=data, headers=headers,
+                                                 timeout=timeout, **kwargs)
             else:
                 error = "http method error!"
                 return None, None, error
@@ -77,11 +84,12 @@ class AsyncHttpRequests(object):
                          "data:", data, "code:", code, "result:", text, caller=cls)
             return code, None, text
         try:
-            result = await response.json()
+            result = await response.json(loads=_json_loads)
         except:
             result = await response.text()
-        logger.debug("method:", method, "url:", url, "headers:", headers, "params:", params, "body:", body,
-                     "data:", data, "code:", code, "result:", json.dumps(result), caller=cls)
+        if logger.debug_enabled():
+            logger.debug("method:", method, "url:", url, "headers:", headers, "params:", params, "body:", body,
+                         "data:", data, "code:", code, "result:", json.dumps(result), caller=cls)
         return code, result, None
 
     @classmethod
@@ -125,6 +133,16 @@ class AsyncHttpRequests(object):
         parsed_url = urlparse(url)
         key = parsed_url.netloc or parsed_url.hostname
         if key not in cls._SESSIONS:
-            session = aiohttp.ClientSession()
+            # Keep DNS results for a while and keep alive connections, so that requests skip DNS and TCP/TLS setup.
+            connector = aiohttp.TCPConnector(ttl_dns_cache=300, limit_per_host=32, keepalive_timeout=KEEPALIVE_TIMEOUT)
+            session = aiohttp.ClientSession(connector=connector)
             cls._SESSIONS[key] = session
         return cls._SESSIONS[key]
+
+    @classmethod
+    async def close(cls):
+        """ Close all the connection sessions."""
+        sessions = list(cls._SESSIONS.values())
+        cls._SESSIONS.clear()
+        for session in sessions:
+            await session.close()
@@ -17,6 +17,7 @@ import traceback
 from logging.handlers import TimedRotatingFileHandler
 
 initialized = False
+_root_logger = logging.getLogger()  # 所有日志都输出到root logger
 
 
 def initLogger(log_level="DEBUG", log_path=None, logfile_name=None, clear=False, backup_count=0):
@@ -50,17 +51,29 @@ def initLogger(log_level="DEBUG", log_path=None, logfile_name=None, clear=False,
     initialized = True
 
 
+def debug_enabled():
+    """ 是否输出DEBUG级别日志，用于在热点路径上跳过无用的日志参数构造
+    """
+    return _root_logger.isEnabledFor(logging.DEBUG)
+
+
 def info(*args, **kwargs):
+    if not _root_logger.isEnabledFor(logging.INFO):
+        return
     func_name, kwargs = _log_msg_header(*args, **kwargs)
     logging.info(_log(func_name, *args, **kwargs))
 
 
 def warn(*args, **kwargs):
+    if not _root_logger.isEnabledFor(logging.WARNING):
+        return
     msg_header, kwargs = _log_msg_header(*args, **kwargs)
     logging.warning(_log(msg_header, *args, **kwargs))
 
 
 def debug(*args, **kwargs):
+    if not _root_logger.isEnabledFor(logging.DEBUG):
+        return
     msg_header, kwargs = _log_msg_header(*args, **kwargs)
     logging.debug(_log(msg_header, *args, **kwargs))
 
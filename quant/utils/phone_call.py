@@ -9,15 +9,40 @@ Date:   2019/03/22
 Email:  huangtao@ifclover.com
 """
 
+import re
+import time
 import hmac
 import base64
-import hashlib
 from urllib import parse
 
 from quant.utils import tools
 from quant.utils.http_client import AsyncHttpRequests
 
 
+# Aliyun voice service API url, requests share the pooled keep-alive session of this host in `AsyncHttpRequests`.
+API_URL = "https://dyvmsapi.aliyuncs.com/"
+
+# Search for any character that is not RFC3986 unreserved, string without these characters needs no percent-encoding.
+_search_reserved = re.compile(r"[^A-Za-z0-9\-._~]").search
+
+
+def _percent_encode(s):
+    """ Percent-encode string as Aliyun signature required, space to `%20`, `*` to `%2A` and `~` is kept."""
+    if not _search_reserved(s):
+        return s
+    res = parse.quote_plus(s.encode("utf8"))
+    res = res.replace("+", "%20").replace("*", "%2A").replace("%7E", "~")
+    return res
+
+
+def _timestamp():
+    """ Current UTC time string for request params, in microseconds, e.g. "2019-03-22T08:00:00.123456Z"."""
+    ns = time.time_ns()
+    t = time.gmtime(ns // 1000000000)
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%06dZ" % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec,
+                                                    ns // 1000 % 1000000)
+
+
 class AliyunPhoneCall:
     """ Aliyun Phone Call API.
 
@@ -30,38 +55,45 @@ class AliyunPhoneCall:
         region_id: Which region to be used, default is `cn-hangzhou`.
     """
 
+    # Request params that are the same for every call.
+    _BASE_PARAMS = {
+        "Version": "2017-05-25",
+        "Action": "SingleCallByVoice",
+        "Format": "JSON",
+        "SignatureMethod": "HMAC-SHA1",
+        "SignatureType": "",
+        "SignatureVersion": "1.0"
+    }
+    # Percent-encoded "key=value" of `_BASE_PARAMS`, e.g. {"Format": "Format=JSON", ... }
+    _BASE_QUERY = {k: _percent_encode(k) + "=" + _percent_encode(v) for k, v in _BASE_PARAMS.items()}
+
+    # All the request param keys in sorted order, which is required by signature.
+    _SORTED_KEYS = tuple(sorted(list(_BASE_PARAMS) + ["VoiceCode", "OutId", "CalledNumber", "CalledShowNumber",
+                                                      "RegionId", "Timestamp", "SignatureNonce", "AccessKeyId"]))
+
     @classmethod
     async def call_phone(cls, access_key, secret_key, _from, to, code, region_id="cn-hangzhou"):
         """ Initialize. """
-        def percent_encode(s):
-            res = parse.quote_plus(s.encode("utf8"))
-            res = res.replace("+", "%20").replace("*", "%2A").replace("%7E", "~")
-            return res
-
-        url = "http://dyvmsapi.aliyuncs.com/"
-        out_id = tools.get_uuid1()
-        nonce = tools.get_uuid1()
-        timestamp = tools.dt_to_date_str(tools.get_utc_time(), fmt="%Y-%m-%dT%H:%M:%S.%fZ")
+        nonce = tools.get_uuid4()  # Random and unique for every request, also used as the call's out id.
+        out_id = nonce
+        timestamp = _timestamp()
 
-        params = {
+        params = cls._BASE_PARAMS.copy()
+        params.update({
             "VoiceCode": code,
             "OutId": out_id,
             "CalledNumber": to,
             "CalledShowNumber": _from,
-            "Version": "2017-05-25",
-            "Action": "SingleCallByVoice",
-            "Format": "JSON",
             "RegionId": region_id,
             "Timestamp": timestamp,
-            "SignatureMethod": "HMAC-SHA1",
-            "SignatureType": "",
-            "SignatureVersion": "1.0",
             "SignatureNonce": nonce,
             "AccessKeyId": access_key
-        }
-        query = "&".join(["{}={}".format(percent_encode(k), percent_encode(params[k])) for k in sorted(params.keys())])
-        str_to_sign = "GET&%2F&" + percent_encode(query)
-        h = hmac.new(bytes(secret_key + "&", "utf8"), bytes(str_to_sign, "utf8"), digestmod=hashlib.sha1)
-        signature = base64.b64encode(h.digest()).decode()
+        })
+        base_query = cls._BASE_QUERY
+        query = "&".join([base_query.get(k) or f"{_percent_encode(k)}={_percent_encode(params[k])}"
+                          for k in cls._SORTED_KEYS])
+        str_to_sign = b"GET&%2F&" + _percent_encode(query).encode("utf8")
+        digest = hmac.digest((secret_key + "&").encode("utf8"), str_to_sign, "sha1")
+        signature = base64.b64encode(digest).decode()
         params["Signature"] = signature
-        await AsyncHttpRequests.fetch("GET", url, params=params)
+        await AsyncHttpRequests.fetch("GET", API_URL, params=params)
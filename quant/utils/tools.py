@@ -11,6 +11,7 @@ Update: 2018/09/07 1. 增加函数datetime_to_timestamp;
 import uuid
 import time
 import decimal
+import calendar
 import datetime
 
 
@@ -24,7 +25,7 @@ def get_cur_timestamp():
 def get_cur_timestamp_ms():
     """ 获取当前时间戳(毫秒)
     """
-    ts = int(time.time() * 1000)
+    ts = time.time_ns() // 1000000  # 整数运算，避免浮点乘法及取整
     return ts
 
 
@@ -142,6 +143,15 @@ def utctime_str_to_mts(utctime_str, fmt="%Y-%m-%dT%H:%M:%S.%fZ"):
     @param fmt 日期时间字符串格式
     @return timestamp 时间戳(毫秒)
     """
+    # 快速路径：固定格式 2019-03-04T09:14:27.806Z 直接切片转换，比 strptime 快一个数量级
+    if fmt == "%Y-%m-%dT%H:%M:%S.%fZ" and len(utctime_str) == 24 and utctime_str[19] == "." and \
+            utctime_str[23] == "Z":
+        try:
+            seconds = calendar.timegm((int(utctime_str[0:4]), int(utctime_str[5:7]), int(utctime_str[8:10]),
+                                       int(utctime_str[11:13]), int(utctime_str[14:16]), int(utctime_str[17:19])))
+            return seconds * 1000 + int(utctime_str[20:23])
+        except ValueError:
+            pass
     dt = datetime.datetime.strptime(utctime_str, fmt)
     timestamp = int(dt.replace(tzinfo=datetime.timezone.utc).astimezone(tz=None).timestamp() * 1000)
     return timestamp
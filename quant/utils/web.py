@@ -10,6 +10,11 @@ Email:  huangtao@ifclover.com
 import json
 import base64
 
+try:
+    from orjson import loads as _json_loads
+except ImportError:  # Fallback to stdlib json if orjson is not installed.
+    _json_loads = json.loads
+
 import aiohttp
 from aiohttp import web
 from urllib.parse import urlparse
@@ -190,7 +195,7 @@ class Websocket:
             if msg.type == aiohttp.WSMsgType.TEXT:
                 if self._process_callback:
                     try:
-                        data = json.loads(msg.data)
+                        data = _json_loads(msg.data)
                     except:
                         data = msg.data
                     SingleTask.run(self._process_callback, data)
@@ -7,14 +7,21 @@ Author: HuangTao
 Date:   2018/06/29
 """
 
-import json
 import aiohttp
 import asyncio
 
+try:
+    from orjson import loads as json_loads  # C实现，解析速度远快于标准库json
+except ImportError:
+    from json import loads as json_loads
+
 from quant.utils import logger
 from quant.config import config
 from quant.heartbeat import heartbeat
 
+# 待处理text消息队列的最大长度，队列满时暂停读取websocket，避免处理不过来时内存无限增长
+MSG_QUEUE_SIZE = 1000
+
 
 class Websocket:
     """ websocket接口封装
@@ -31,6 +38,8 @@ class Websocket:
         self._send_hb_interval = send_hb_interval
         self.ws = None  # websocket连接对象
         self.heartbeat_msg = None  # 心跳消息
+        self._msg_queue = asyncio.Queue(maxsize=MSG_QUEUE_SIZE)  # 已接收、待处理的text消息队列
+        self._dispatch_task = None  # 消息分发协程
 
     def initialize(self):
         """ 初始化
@@ -70,13 +79,16 @@ class Websocket:
     async def receive(self):
         """ 接收消息
         """
+        # 启动消息分发协程，只启动一次
+        if not self._dispatch_task:
+            self._dispatch_task = asyncio.get_event_loop().create_task(self._dispatch())
         async for msg in self.ws:
             if msg.type == aiohttp.WSMsgType.TEXT:
                 try:
-                    data = json.loads(msg.data)
+                    data = json_loads(msg.data)
                 except:
                     data = msg.data
-                await asyncio.get_event_loop().create_task(self.process(data))
+                await self._msg_queue.put(data)  # 队列满时等待，形成背压
             elif msg.type == aiohttp.WSMsgType.BINARY:
                 await asyncio.get_event_loop().create_task(self.process_binary(msg.data))
             elif msg.type == aiohttp.WSMsgType.CLOSED:
@@ -88,6 +100,31 @@ class Websocket:
             else:
                 logger.warn("unhandled msg:", msg, caller=self)
 
+    async def _dispatch(self):
+        """ 分发text消息，每次取出队列里所有已到达的消息，批量交给 `process_batch` 处理
+        """
+        queue = self._msg_queue
+        while True:
+            msgs = [await queue.get()]
+            while not queue.empty():
+                msgs.append(queue.get_nowait())
+            try:
+                await self.process_batch(msgs)
+            except Exception as e:  # 兜底，`process_batch` 应该逐条捕获异常
+                logger.exception("process msgs error:", e, caller=self)
+
+    async def process_batch(self, msgs):
+        """ 批量处理websocket上接收到的消息 text 类型
+        @param msgs 消息列表，按接收顺序排列
+        * NOTE: 默认逐条调用 `process`，子类可以重写此方法以减少协程调度开销，
+                重写时需要逐条捕获异常，避免一条消息处理失败导致同批次后续的消息被丢弃
+        """
+        for msg in msgs:
+            try:
+                await self.process(msg)
+            except Exception as e:
+                logger.exception("process msg error:", e, "msg:", msg, caller=self)
+
     async def process(self, msg):
         """ 处理websocket上接收到的消息 text 类型
         * NOTE: 子类继承实现
@@ -1,16 +1,13 @@
 # -*- coding:utf-8 -*-
 
-from distutils.core import setup
+from setuptools import setup, find_packages
 
 
 setup(
     name="thenextquant",
     version="0.1.9",
-    packages=[
-        "quant",
-        "quant.utils",
-        "quant.platform",
-    ],
+    packages=find_packages(include=["quant", "quant.*"]),
+    python_requires=">=3.8",
     description="Asynchronous driven quantitative trading framework.",
     url="https://github.com/TheNextQuant/thenextquant",
     author="huangtao",
@@ -21,8 +18,10 @@ setup(
         "marketmaker", "binance", "okex", "huobi", "bitmex", "deribit", "kraken", "gemini", "kucoin"
     ],
     install_requires=[
-        "aiohttp==3.2.1",
-        "aioamqp==0.13.0",
-        "motor==2.0.0"
+        "aiohttp>=3.8,<4",
+        "aioamqp>=0.15"
     ],
+    extras_require={
+        "mongo": ["motor>=3.0"]
+    },
 )